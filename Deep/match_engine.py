@@ -0,0 +1,301 @@
+"""
+Symmetric offer/order matching engine.
+Both sides are kept as L2-normalised embedding matrices, so a new offer is
+scored against every open order (and a new order against every offer) with a
+single matrix product instead of a full recompute.
+"""
+
+import bisect
+import heapq
+import itertools
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from predictors.profiling import span
+
+SIDES = ("offer", "order")
+
+
+def select_top_matches(candidates, top_k, per_seller):
+    """Keep at most `per_seller` offers per seller number, then the best `top_k` by score.
+
+    Each seller holds a bounded min-heap, so memory stays O(sellers * per_seller)
+    however broad the order is.
+    """
+    tie = itertools.count()
+    per_seller_heaps = {}
+    for score, offer in candidates:
+        heap = per_seller_heaps.setdefault(offer.get("number"), [])
+        entry = (score, next(tie), offer)
+        if per_seller <= 0 or len(heap) < per_seller:
+            heapq.heappush(heap, entry)
+        elif score > heap[0][0]:
+            heapq.heapreplace(heap, entry)
+
+    pool = itertools.chain.from_iterable(per_seller_heaps.values())
+    if top_k > 0:
+        best = heapq.nlargest(top_k, pool)
+    else:
+        best = sorted(pool, reverse=True)
+    return [(score, offer) for score, _, offer in best]
+
+
+class PriceIndex:
+    """Per-currency sorted (amount, position) lists for range queries.
+
+    Amounts without a stated currency are kept under None and are compared
+    with every currency, since most messages only say "4900" or "3.5k".
+    """
+
+    def __init__(self):
+        self._amounts = {}    # currency -> sorted amounts
+        self._positions = {}  # currency -> positions aligned with _amounts
+
+    def add(self, position, amount, currency):
+        amounts = self._amounts.setdefault(currency, [])
+        i = bisect.bisect_right(amounts, amount)
+        amounts.insert(i, amount)
+        self._positions.setdefault(currency, []).insert(i, position)
+
+    def _comparable(self, currency):
+        return self._amounts if currency is None else [c for c in (currency, None) if c in self._amounts]
+
+    def above(self, limit, currency):
+        """Positions whose amount is > limit"""
+        out = []
+        for c in self._comparable(currency):
+            out.extend(self._positions[c][bisect.bisect_right(self._amounts[c], limit):])
+        return out
+
+    def below(self, limit, currency):
+        """Positions whose amount is < limit"""
+        out = []
+        for c in self._comparable(currency):
+            out.extend(self._positions[c][:bisect.bisect_left(self._amounts[c], limit)])
+        return out
+
+
+def representative_price(doc, pick):
+    """Pick one {"amount", "currency"} from a doc's extracted prices (min for offers, max for budgets).
+
+    Amounts with a stated currency win over bare ones ("k28 size 25, 14500 eur").
+    """
+    prices = [price for price in doc.get("prices") or [] if isinstance(price, dict)]
+    prices = [price for price in prices if price.get("currency")] or prices
+    return pick(prices, key=lambda price: price["amount"]) if prices else None
+
+
+class SideIndex:
+    """Append-only embedding index for one side (offers or orders)."""
+
+    def __init__(self, dim=0, price_pick=min):
+        self.ids = []
+        self.docs = {}
+        self.positions = {}
+        self.prices = PriceIndex()
+        self.price_pick = price_pick
+        self._vectors = np.zeros((0, dim), dtype=np.float32)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def vectors(self):
+        return self._vectors[:self._size]
+
+    def add(self, docs, vectors):
+        """Append docs with their (already normalised) vectors; existing ids are skipped."""
+        fresh = [i for i, doc in enumerate(docs) if doc["id"] not in self.positions]
+        if not fresh:
+            return []
+        vectors = np.asarray(vectors, dtype=np.float32)[fresh]
+        needed = self._size + len(fresh)
+        if self._vectors.shape[1] != vectors.shape[1]:
+            self._vectors = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+        if needed > self._vectors.shape[0]:
+            # Grow geometrically so repeated single-message adds stay amortised O(1)
+            grown = np.zeros((max(needed, 2 * self._vectors.shape[0], 64), vectors.shape[1]), dtype=np.float32)
+            grown[:self._size] = self.vectors
+            self._vectors = grown
+        self._vectors[self._size:needed] = vectors
+
+        added = []
+        for row, i in enumerate(fresh):
+            doc = docs[i]
+            self.positions[doc["id"]] = self._size + row
+            self.ids.append(doc["id"])
+            self.docs[doc["id"]] = doc
+            price = representative_price(doc, self.price_pick)
+            if price:
+                self.prices.add(self._size + row, price["amount"], price["currency"])
+            added.append(doc)
+        self._size = needed
+        return added
+
+    def query(self, vectors, threshold, top_k, excluded=None):
+        """Return, per query vector, a list of (score, doc_id) above threshold, best first.
+
+        `excluded` optionally gives, per query vector, positions to drop before scoring.
+        """
+        if not self._size or not len(vectors):
+            return [[] for _ in range(len(vectors))]
+        vectors = np.asarray(vectors, dtype=np.float32)
+        excluded = excluded or [None] * len(vectors)
+        hits = []
+        for vector, skip in zip(vectors, excluded):
+            if skip:
+                # Score only the remaining candidates
+                columns = np.setdiff1d(np.arange(self._size), np.asarray(skip, dtype=np.int64), assume_unique=True)
+                row = self.vectors[columns] @ vector
+            else:
+                columns = None
+                row = self.vectors @ vector
+            candidates = np.flatnonzero(row >= threshold)
+            if top_k > 0 and len(candidates) > top_k:
+                keep = np.argpartition(row[candidates], -top_k)[-top_k:]
+                candidates = candidates[keep]
+            candidates = candidates[np.argsort(-row[candidates])]
+            positions = candidates if columns is None else columns[candidates]
+            hits.append([(float(row[c]), self.ids[p]) for c, p in zip(candidates, positions)])
+        return hits
+
+
+class MatchEngine:
+    """Keeps offers and orders indexed and maintains the order -> offers match store."""
+
+    def __init__(self, encode, threshold=0.60, top_k=20, per_seller=3, price_tolerance=0.15):
+        # `encode` maps a list of texts to an (n, dim) array of normalised vectors
+        self.encode = encode
+        self.threshold = threshold
+        self.top_k = top_k
+        self.per_seller = per_seller
+        # An offer may cost up to this fraction above an order's stated budget (None disables price filtering)
+        self.price_tolerance = price_tolerance
+        # Offers are indexed by their lowest price, orders by their highest (the budget)
+        self.index = {"offer": SideIndex(price_pick=min), "order": SideIndex(price_pick=max)}
+        self.matches = {}  # order id -> {offer id: score}
+        # High-water mark of processed messages, persisted with every save()
+        self.checkpoint = {}
+
+    def _unaffordable(self, side, docs):
+        """Per doc, positions on the other side ruled out by price before any scoring"""
+        if self.price_tolerance is None:
+            return None
+        excluded = []
+        for doc in docs:
+            if side == "order":
+                budget = representative_price(doc, max)
+                # Offers priced above the budget
+                excluded.append(self.index["offer"].prices.above(budget["amount"] * (1 + self.price_tolerance), budget["currency"]) if budget else None)
+            else:
+                price = representative_price(doc, min)
+                # Orders whose budget is below this offer's price
+                excluded.append(self.index["order"].prices.below(price["amount"] / (1 + self.price_tolerance), price["currency"]) if price else None)
+        return excluded
+
+    def knows(self, doc_id):
+        """True if the id is already indexed on either side"""
+        return any(doc_id in self.index[side].positions for side in SIDES)
+
+    def add(self, side, docs):
+        """Index new docs on one side and match them against the other side.
+
+        Returns the ids of orders whose match list changed.
+        """
+        docs = list({doc["id"]: doc for doc in docs if doc["id"] not in self.index[side].positions}.values())
+        if not docs:
+            return set()
+        with span("encode"):
+            vectors = self.encode([doc["text"] for doc in docs])
+        added = self.index[side].add(docs, vectors)
+        other = "order" if side == "offer" else "offer"
+        with span("price_filter"):
+            excluded = self._unaffordable(side, added)
+        # Every hit above threshold is kept and _trim() applies the caps: a fixed fetch
+        # limit can be used up by one seller's reposts, leaving fewer than top_k offers
+        with span("similarity_query"):
+            hits = self.index[other].query(vectors, self.threshold, 0, excluded)
+
+        touched = set()
+        for doc, doc_hits in zip(added, hits):
+            for score, other_id in doc_hits:
+                order_id, offer_id = (other_id, doc["id"]) if side == "offer" else (doc["id"], other_id)
+                self.matches.setdefault(order_id, {})[offer_id] = score
+                touched.add(order_id)
+        with span("top_k_trim"):
+            for order_id in touched:
+                self._trim(order_id)
+        return touched
+
+    def _trim(self, order_id):
+        offers = self.index["offer"].docs
+        kept = select_top_matches(
+            ((score, offers[offer_id]) for offer_id, score in self.matches[order_id].items()),
+            self.top_k, self.per_seller,
+        )
+        self.matches[order_id] = {offer["id"]: score for score, offer in kept}
+
+    def results(self):
+        """Yield (order doc, [(score, offer doc), ...]) in order-arrival order, best offer first."""
+        orders = self.index["order"].docs
+        offers = self.index["offer"].docs
+        for order_id in self.index["order"].ids:
+            matched = self.matches.get(order_id)
+            if not matched:
+                continue
+            ranked = sorted(matched.items(), key=lambda item: item[1], reverse=True)
+            yield orders[order_id], [(score, offers[offer_id]) for offer_id, score in ranked]
+
+    def save(self, path):
+        """Atomically checkpoint both indexes, the match store and `self.checkpoint` to one file."""
+        state = {
+            "docs": {side: [self.index[side].docs[i] for i in self.index[side].ids] for side in SIDES},
+            "matches": self.matches,
+            "checkpoint": self.checkpoint,
+        }
+        arrays = {f"{side}_vectors": self.index[side].vectors for side in SIDES}
+        with span("checkpoint_save"):
+            # UTF-8 bytes, not a numpy str array (which stores 4 bytes per character)
+            arrays["state"] = np.frombuffer(json.dumps(state, ensure_ascii=False).encode("utf-8"), dtype=np.uint8)
+            write_atomic(path, lambda f: np.savez(f, **arrays))
+
+    @classmethod
+    def load(cls, path, encode, **kwargs):
+        """Load a checkpoint; returns None if nothing has been saved yet."""
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as saved:
+            raw = saved["state"]
+            # Older checkpoints stored the state as a numpy str array
+            state = json.loads(str(raw) if raw.dtype.kind == "U" else raw.tobytes().decode("utf-8"))
+            vectors = {side: saved[f"{side}_vectors"] for side in SIDES}
+        engine = cls(encode, **kwargs)
+        for side in SIDES:
+            engine.index[side].add(state["docs"][side], vectors[side])
+        engine.matches = state["matches"]
+        engine.checkpoint = state.get("checkpoint") or {}
+        return engine
+
+
+def write_atomic(path, write):
+    """Write via `write(file)` to a temp file in the same directory, fsync, then rename over `path`.
+
+    Readers and a restarted process only ever see the old or the new file, never a partial one.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,105 @@
+"""
+Debounced match scheduler.
+Message ids are queued as they arrive and flushed to a single batched
+matching pass once the stream goes quiet for `debounce` seconds, the batch
+reaches `max_batch` ids, or the oldest id has waited `max_delay` seconds.
+A failed batch is queued again after `retry_delay` seconds, up to
+`max_retries` times per id.
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class MatchScheduler:
+    def __init__(self, process_batch, debounce=0.5, max_batch=100, max_delay=5.0, max_retries=3, retry_delay=1.0):
+        # `process_batch` receives a list of unique message ids
+        self.process_batch = process_batch
+        self.debounce = debounce
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._failures = {}  # message id -> failed attempts so far
+        self._pending = {}  # message id -> first submit time (dict keeps arrival order)
+        self._last_submit = 0.0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._worker = threading.Thread(target=self._run, name="match-scheduler", daemon=True)
+        self._worker.start()
+
+    def submit(self, message_id):
+        """Queue a message id; returns False if it was already pending (merged)."""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("scheduler is closed")
+            now = time.monotonic()
+            self._last_submit = now
+            if message_id in self._pending:
+                return False
+            self._pending[message_id] = now
+            self._cond.notify()
+            return True
+
+    def close(self, flush=True):
+        """Stop the worker, optionally running one last pass over pending ids."""
+        with self._cond:
+            self._closed = True
+            if not flush:
+                self._pending.clear()
+            self._cond.notify()
+        self._worker.join()
+
+    def _wait_for_batch(self):
+        """Block until a batch is due and pop it; returns None once closed and drained."""
+        with self._cond:
+            while True:
+                if not self._pending:
+                    if self._closed:
+                        return None
+                    self._cond.wait()
+                    continue
+                now = time.monotonic()
+                oldest = next(iter(self._pending.values()))
+                due = min(self._last_submit + self.debounce, oldest + self.max_delay)
+                if self._closed or len(self._pending) >= self.max_batch or now >= due:
+                    ids = list(self._pending)[:self.max_batch]
+                    for message_id in ids:
+                        del self._pending[message_id]
+                    return ids
+                self._cond.wait(due - now)
+
+    def _run(self):
+        while True:
+            ids = self._wait_for_batch()
+            if ids is None:
+                return
+            try:
+                self.process_batch(ids)
+            except Exception as e:
+                logger.error(f"Batch of {len(ids)} messages failed: {e}")
+                self._retry(ids)
+            else:
+                with self._cond:
+                    for message_id in ids:
+                        self._failures.pop(message_id, None)
+
+    def _retry(self, ids):
+        """Queue a failed batch again after retry_delay, dropping ids out of retries."""
+        with self._cond:
+            # New submits notify the condition, so wait out the full delay
+            deadline = time.monotonic() + self.retry_delay
+            while not self._closed and time.monotonic() < deadline:
+                self._cond.wait(deadline - time.monotonic())
+            now = time.monotonic()
+            for message_id in ids:
+                failures = self._failures.get(message_id, 0) + 1
+                if failures > self.max_retries:
+                    self._failures.pop(message_id, None)
+                    logger.error(f"Giving up on message {message_id} after {failures} attempts")
+                    continue
+                self._failures[message_id] = failures
+                self._pending.setdefault(message_id, now)
@@ -1,17 +1,49 @@
 from pymongo import MongoClient
-from sentence_transformers import SentenceTransformer, util
+from sentence_transformers import SentenceTransformer
+from bson import ObjectId
 import pandas as pd
+import argparse
+import itertools
 import json
 import re
+import sys
+import time
 from dotenv import load_dotenv
 import os
 
+from match_engine import SIDES, MatchEngine, write_atomic
+from match_scheduler import MatchScheduler
+from predictors.preprocess import get_preprocessor
+from predictors.profiling import profiler, span
+
 # ✅ Load environment variables from .env
 load_dotenv()
 
 # ✅ Get MongoDB URI from .env
 MONGO_URI = os.getenv("MONGO_URI")
 
+# ✅ Match output limits (override in .env)
+MATCH_THRESHOLD = float(os.getenv("MATCH_THRESHOLD", "0.60"))
+MATCH_TOP_K = int(os.getenv("MATCH_TOP_K", "20"))            # max offers kept per order
+MATCH_PER_SELLER = int(os.getenv("MATCH_PER_SELLER", "3"))   # max offers per seller number
+MATCH_PRICE_TOLERANCE = float(os.getenv("MATCH_PRICE_TOLERANCE", "0.15"))  # how far over budget an offer may be
+
+# ✅ Where the offer/order indexes and the processed-message high-water mark are checkpointed
+MATCH_CHECKPOINT_PATH = os.getenv("MATCH_CHECKPOINT_PATH", "/root/whatsapp-bot_v2/Deep/match_checkpoint.npz")
+MATCH_CHECKPOINT_EVERY = int(os.getenv("MATCH_CHECKPOINT_EVERY", "1000"))  # messages per catch-up chunk
+# A save rewrites the whole index, so catch-up saves once the unsaved messages reach
+# this fraction of the index: total checkpoint writes stay linear in the history
+MATCH_CHECKPOINT_GROWTH = float(os.getenv("MATCH_CHECKPOINT_GROWTH", "0.25"))
+MATCH_RESULTS_PATH = "/root/whatsapp-bot_v2/match_results.json"
+
+# ✅ Scheduler mode (--serve): coalesce bursts of new message ids into one pass
+MATCH_DEBOUNCE_MS = int(os.getenv("MATCH_DEBOUNCE_MS", "500"))
+MATCH_MAX_BATCH = int(os.getenv("MATCH_MAX_BATCH", "100"))
+# Checkpoint after this many batches or seconds, whichever comes first; anything
+# newer is replayed from the high-water mark by catch_up() after a restart
+MATCH_SERVE_CHECKPOINT_BATCHES = int(os.getenv("MATCH_SERVE_CHECKPOINT_BATCHES", "20"))
+MATCH_SERVE_CHECKPOINT_SECONDS = float(os.getenv("MATCH_SERVE_CHECKPOINT_SECONDS", "60"))
+
 # ✅ Connect to MongoDB using .env URI
 client = MongoClient(MONGO_URI)
 db = client.whatsappdb
@@ -27,81 +59,222 @@ for _, row in df.iterrows():
     if key and val:
         abbreviation_map[key] = val
 
-# Normalize text by replacing known brand/type variants using the map
+# Normalize preprocessed (lowercased) text by replacing known brand/type variants using the map
 def normalize(text):
-    text = text.lower()
     text = re.sub(r"[^\w\s]", "", text)  # remove punctuation
     words = text.split()
     normalized = [abbreviation_map.get(word, word) for word in words]
     return " ".join(normalized)
 
-# ✅ Fetch messages & numbers from DB
-messages = list(db.messages.find({}))
-number_entries = {entry['number']: entry.get('name', '') for entry in db.numberentries.find({})}
+model = SentenceTransformer("all-MiniLM-L6-v2")
 
-orders = [m for m in messages if m.get('category') == 'order']
-offers = [m for m in messages if m.get('category') == 'offer']
+# Encode a batch of texts into unit vectors, so cosine similarity is a dot product
+def encode(texts):
+    return model.encode(texts, batch_size=64, convert_to_numpy=True, normalize_embeddings=True)
 
-model = SentenceTransformer("all-MiniLM-L6-v2")
-results = []
+ENGINE_OPTIONS = dict(threshold=MATCH_THRESHOLD, top_k=MATCH_TOP_K, per_seller=MATCH_PER_SELLER,
+                      price_tolerance=MATCH_PRICE_TOLERANCE)
 
-for order in orders:
-    order_text = order.get("translated") or order.get("message", "")
-    if not order_text.strip():
-        continue
+def new_engine():
+    return MatchEngine(encode, **ENGINE_OPTIONS)
 
-    norm_order_text = normalize(order_text)
-    order_vec = model.encode(norm_order_text, convert_to_tensor=True)
-    matched_offers = []
+def load_engine():
+    return MatchEngine.load(MATCH_CHECKPOINT_PATH, encode, **ENGINE_OPTIONS)
 
-    for offer in offers:
-        offer_text = offer.get("translated") or offer.get("message", "")
-        if not offer_text.strip():
-            continue
+preprocessor = get_preprocessor()
 
-        norm_offer_text = normalize(offer_text)
-        offer_vec = model.encode(norm_offer_text, convert_to_tensor=True)
-        score = float(util.cos_sim(order_vec, offer_vec))
-
-        if score >= 0.60:  # Reasonable threshold for good matches
-            offer_name = offer.get("name") or number_entries.get(offer["number"], "")
-            offer_link = offer.get("link", "")
-            matched_offers.append({
-                "offer": {
-                    "number": offer["number"],
-                    "name": offer_name,
-                    "message": offer["message"],
-                    "translated": offer.get("translated", ""),
-                    "language": offer.get("language", ""),
-                    "price": offer.get("price", ""),
-                    "timestamp": str(offer["timestamp"]),
-                    "link": offer_link,
-                    "button": f'<a href="{offer_link}" class="btn btn-success btn-sm" target="_blank">Go Offer</a>' if offer_link else ""
-                },
-                "score": round(score * 100, 2)
-            })
-
-    if matched_offers:
-        order_name = order.get("name") or number_entries.get(order["number"], "")
-        order_link = order.get("link", "")
+# Reduce a Mongo message to the JSON-safe fields the engine indexes and the UI shows
+def to_doc(message, processed):
+    if not processed["lower"]:
+        return None
+    return {
+        "id": str(message["_id"]),
+        "text": normalize(processed["lower"]),
+        "prices": processed["prices"],
+        "script": processed["script"],
+        "number": message["number"],
+        "name": message.get("name", ""),
+        "message": message["message"],
+        "translated": message.get("translated", ""),
+        "language": message.get("language", ""),
+        "price": message.get("price", ""),
+        "timestamp": str(message["timestamp"]),
+        "link": message.get("link", ""),
+    }
+
+def split_docs(messages):
+    sides = {"offer": [], "order": []}
+    messages = [m for m in messages if m.get("category") in sides]
+    # Cleanup, price extraction and script tagging are shared with the classifier via the cache
+    with span("preprocess"):
+        processed = preprocessor.process_many([m.get("translated") or m.get("message", "") for m in messages])
+    for m, p in zip(messages, processed):
+        doc = to_doc(m, p)
+        if doc:
+            sides[m["category"]].append(doc)
+    preprocessor.flush()
+    return sides
+
+def format_entry(doc, number_entries, button_class, button_label):
+    link = doc.get("link", "")
+    return {
+        "number": doc["number"],
+        "name": doc.get("name") or number_entries.get(doc["number"], ""),
+        "message": doc["message"],
+        "translated": doc.get("translated", ""),
+        "language": doc.get("language", ""),
+        "price": doc.get("price", ""),
+        "timestamp": doc["timestamp"],
+        "link": link,
+        "button": f'<a href="{link}" class="btn {button_class} btn-sm" target="_blank">{button_label}</a>' if link else ""
+    }
+
+def build_results(engine, number_entries):
+    results = []
+    for order, matched in engine.results():
         results.append({
-            "order": {
-                "number": order["number"],
-                "name": order_name,
-                "message": order["message"],
-                "translated": order.get("translated", ""),
-                "language": order.get("language", ""),
-                "price": order.get("price", ""),
-                "timestamp": str(order["timestamp"]),
-                "link": order_link,
-                "button": f'<a href="{order_link}" class="btn btn-primary btn-sm" target="_blank">Go Order</a>' if order_link else ""
-            },
-            "matches": matched_offers
+            "order": format_entry(order, number_entries, "btn-primary", "Go Order"),
+            "matches": [
+                {
+                    "offer": format_entry(offer, number_entries, "btn-success", "Go Offer"),
+                    "score": round(score * 100, 2)
+                }
+                for score, offer in matched
+            ]
         })
+    return results
+
+def fetch_messages(message_ids):
+    with span("mongo_read"):
+        return list(db.messages.find({"_id": {"$in": [ObjectId(i) for i in message_ids]}}))
+
+# Messages not yet in the index (e.g. not already handled by catch_up)
+def unseen(engine, messages):
+    return [m for m in messages if not engine.knows(str(m["_id"]))]
+
+# ✅ Incremental: look up only the given messages against the opposite side
+def add_messages(engine, messages):
+    sides = split_docs(messages)
+    touched = set()
+    for side in ("offer", "order"):
+        touched |= engine.add(side, sides[side])
+    return touched
+
+# Move the high-water mark past a batch of processed messages; only messages
+# beyond the previous mark are counted, so replays are not counted twice
+def advance_checkpoint(engine, messages):
+    checkpoint = engine.checkpoint
+    last_id = ObjectId(checkpoint["last_id"]) if checkpoint.get("last_id") else None
+    fresh = [m for m in messages if last_id is None or m["_id"] > last_id]
+    if fresh:
+        newest = max(fresh, key=lambda m: m["_id"])
+        checkpoint["last_id"] = str(newest["_id"])
+        checkpoint["last_timestamp"] = str(newest.get("timestamp", ""))
+    checkpoint["processed"] = checkpoint.get("processed", 0) + len(fresh)
+
+# ✅ Resume: process only messages stored after the checkpoint in chunks of
+# MATCH_CHECKPOINT_EVERY, saving as the index grows (the caller saves at the end)
+def catch_up(engine):
+    last_id = engine.checkpoint.get("last_id")
+    query = {"_id": {"$gt": ObjectId(last_id)}} if last_id else {}
+    cursor = db.messages.find(query).sort("_id", 1)
+    unsaved = 0
+    while True:
+        with span("mongo_read"):
+            batch = list(itertools.islice(cursor, MATCH_CHECKPOINT_EVERY))
+        if not batch:
+            return
+        add_messages(engine, batch)
+        advance_checkpoint(engine, batch)
+        unsaved += len(batch)
+        indexed = sum(len(engine.index[side]) for side in SIDES)
+        if unsaved >= max(MATCH_CHECKPOINT_EVERY, indexed * MATCH_CHECKPOINT_GROWTH):
+            engine.save(MATCH_CHECKPOINT_PATH)
+            unsaved = 0
+
+def write_results(engine):
+    with span("mongo_read"):
+        number_entries = {entry['number']: entry.get('name', '') for entry in db.numberentries.find({})}
+    with span("build_results"):
+        results = build_results(engine, number_entries)
+
+    # ✅ Save results to JSON file (temp file + rename, never half-written)
+    with span("json_serialize"):
+        payload = json.dumps(results, indent=2, ensure_ascii=False).encode("utf-8")
+    with span("results_write"):
+        write_atomic(MATCH_RESULTS_PATH, lambda f: f.write(payload))
+    return results
+
+# ✅ Long-running mode: read one message id per line from stdin and match in
+# debounced batches; one JSON status line is printed per batch
+def serve(engine):
+    # A full save rewrites the whole history, so it is not done on every burst
+    unsaved = {"batches": 0, "since": time.monotonic()}
+
+    def save():
+        engine.save(MATCH_CHECKPOINT_PATH)
+        unsaved.update(batches=0, since=time.monotonic())
+
+    def process_batch(message_ids):
+        with span("batch"):
+            messages = unseen(engine, fetch_messages(message_ids))
+            touched = add_messages(engine, messages)
+            advance_checkpoint(engine, messages)
+            unsaved["batches"] += 1
+            if (unsaved["batches"] >= MATCH_SERVE_CHECKPOINT_BATCHES
+                    or time.monotonic() - unsaved["since"] >= MATCH_SERVE_CHECKPOINT_SECONDS):
+                save()
+            if touched:
+                write_results(engine)
+        # Cumulative span report, overwritten after every batch (no-op unless PROFILE is set)
+        profiler.write("matcher-serve", stamp=False)
+        print(json.dumps({"batch": len(message_ids), "orders_updated": len(touched)}), flush=True)
+
+    scheduler = MatchScheduler(process_batch, debounce=MATCH_DEBOUNCE_MS / 1000, max_batch=MATCH_MAX_BATCH)
+    for line in sys.stdin:
+        message_id = line.strip()
+        # One malformed id would make ObjectId() fail the whole batch
+        if not ObjectId.is_valid(message_id):
+            if message_id:
+                print(json.dumps({"error": "invalid message id", "id": message_id}), flush=True)
+            continue
+        scheduler.submit(message_id)
+    scheduler.close()
+    if unsaved["batches"]:
+        save()
+
+def main():
+    parser = argparse.ArgumentParser(description="Match WhatsApp orders with offers")
+    parser.add_argument("--message-id", action="append", default=[],
+                        help="match only this new message against the saved index (repeatable)")
+    parser.add_argument("--rebuild", action="store_true", help="ignore the checkpoint and recompute everything")
+    parser.add_argument("--serve", action="store_true", help="scheduler mode: read message ids from stdin")
+    args = parser.parse_args()
+
+    engine = None if args.rebuild else load_engine()
+    if engine is None:
+        engine = new_engine()
+
+    # Anything stored since the last checkpoint (everything on a first run or --rebuild)
+    catch_up(engine)
+    if args.message_id:
+        # Usually already covered by catch_up(); only ids it did not index are added
+        messages = unseen(engine, fetch_messages(args.message_id))
+        add_messages(engine, messages)
+        advance_checkpoint(engine, messages)
+    engine.save(MATCH_CHECKPOINT_PATH)
+
+    if args.serve:
+        write_results(engine)
+        serve(engine)
+        return
+
+    results = write_results(engine)
 
-# ✅ Save results to JSON file
-with open("/root/whatsapp-bot_v2/match_results.json", "w", encoding="utf-8") as f:
-    json.dump(results, f, indent=2, ensure_ascii=False)
+    # ✅ Print JSON output for Node.js to capture
+    print(json.dumps(results))
 
-# ✅ Print JSON output for Node.js to capture
-print(json.dumps(results))
+if __name__ == "__main__":
+    # PROFILE=spans|cprofile writes a span report / cProfile dump to PROFILE_DIR on exit
+    with profiler.run("matcher"):
+        main()
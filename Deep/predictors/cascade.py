@@ -0,0 +1,111 @@
+"""
+Confidence-gated classification cascade.
+Cheap tiers run first and only the messages they cannot decide are passed,
+as one batch, to the next tier:
+
+    rules (PerfectClassifier) -> fast n-gram model -> embedding centroids
+"""
+
+import threading
+import time
+
+from profiling import span
+
+TIERS = ("rules", "fast", "embedding", "fallback")
+
+
+class CascadeStats:
+    """Thread-safe per-tier counters: how many messages each tier saw and decided, and time spent."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.messages = 0
+            self.seen = {tier: 0 for tier in TIERS}
+            self.decided = {tier: 0 for tier in TIERS}
+            self.seconds = {tier: 0.0 for tier in TIERS}
+
+    def record(self, tier, seen, decided, seconds):
+        with self._lock:
+            self.seen[tier] += seen
+            self.decided[tier] += decided
+            self.seconds[tier] += seconds
+
+    def add_messages(self, count):
+        with self._lock:
+            self.messages += count
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "messages": self.messages,
+                "tiers": {
+                    tier: {
+                        "seen": self.seen[tier],
+                        "decided": self.decided[tier],
+                        "hit_rate": round(self.decided[tier] / self.messages, 4) if self.messages else 0.0,
+                        "avg_ms_per_message": round(self.seconds[tier] / self.seen[tier] * 1000, 4) if self.seen[tier] else 0.0,
+                        "total_seconds": round(self.seconds[tier], 3)
+                    }
+                    for tier in TIERS
+                }
+            }
+
+
+class ClassificationCascade:
+    def __init__(self, classifier, fast_model=None, embedding_model=None,
+                 fast_confidence=0.8, embedding_confidence=0.5):
+        self.classifier = classifier
+        self.fast_model = fast_model
+        self.embedding_model = embedding_model
+        self.fast_confidence = fast_confidence
+        self.embedding_confidence = embedding_confidence
+        self.stats = CascadeStats()
+
+    def predict(self, texts):
+        """Return [{"category", "confidence", "method"}, ...] for a batch of texts"""
+        results = [None] * len(texts)
+        self.stats.add_messages(len(texts))
+
+        pending = list(range(len(texts)))
+        start = time.perf_counter()
+        undecided = []
+        with span("cascade.rules"):
+            # One batched cache lookup; classify() then hits the in-memory cache
+            self.classifier.preprocessor.process_many(texts)
+            for i in pending:
+                category = self.classifier.classify(texts[i])
+                if category != "unknown":
+                    results[i] = {"category": category, "confidence": 1.0, "method": "rules"}
+                else:
+                    undecided.append(i)
+        self.stats.record("rules", len(pending), len(pending) - len(undecided), time.perf_counter() - start)
+        pending = undecided
+
+        for tier, model, threshold in (("fast", self.fast_model, self.fast_confidence),
+                                       ("embedding", self.embedding_model, self.embedding_confidence)):
+            if model is None or not pending:
+                continue
+            start = time.perf_counter()
+            undecided = []
+            with span(f"cascade.{tier}"):
+                predictions = model.predict([texts[i] for i in pending])
+            for i, (category, confidence) in zip(pending, predictions):
+                if confidence >= threshold:
+                    results[i] = {"category": category, "confidence": round(confidence, 4), "method": tier}
+                else:
+                    undecided.append(i)
+            self.stats.record(tier, len(pending), len(pending) - len(undecided), time.perf_counter() - start)
+            pending = undecided
+
+        # No tier was confident: keep the rules' answer
+        for i in pending:
+            results[i] = {"category": "unknown", "confidence": 1.0, "method": "fallback"}
+        self.stats.record("fallback", len(pending), len(pending), 0.0)
+        return results
+
+    def classify(self, text):
+        return self.predict([text])[0]
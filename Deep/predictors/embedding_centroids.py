@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Nearest-centroid classifier on MiniLM sentence embeddings (the same model
+matcher.py uses). One unit centroid per label is built from the labelled
+12k set; classification is a batched encode plus one small matrix product.
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+LABELS = ['Order', 'Offer', 'unknown']
+DATASET_PATH = '/root/whatsapp-bot_v2/augmented_whatsapp_12k_balanced.jsonl'
+CENTROIDS_PATH = os.getenv("CENTROIDS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "centroids.npz"))
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+
+class CentroidClassifier:
+    def __init__(self, centroids, model=None, temperature=0.05):
+        self.centroids = centroids          # (labels, dim), rows L2-normalised
+        if model is None:
+            # Imported here so loading this module does not pull in torch
+            from sentence_transformers import SentenceTransformer
+            model = SentenceTransformer(EMBEDDING_MODEL)
+        self.model = model
+        self.temperature = temperature      # softmax temperature over cosine similarities
+
+    def encode(self, texts):
+        return self.model.encode(texts, batch_size=64, convert_to_numpy=True, normalize_embeddings=True)
+
+    def predict(self, texts):
+        """Return [(label, confidence), ...] for a batch of texts"""
+        if not texts:
+            return []
+        similarities = self.encode(texts) @ self.centroids.T
+        logits = (similarities - similarities.max(axis=1, keepdims=True)) / self.temperature
+        probabilities = np.exp(logits)
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+        best = probabilities.argmax(axis=1)
+        return [(LABELS[i], float(probabilities[row, i])) for row, i in enumerate(best)]
+
+    @classmethod
+    def build(cls, texts, labels, model=None):
+        classifier = cls(np.zeros((len(LABELS), 1), dtype=np.float32), model)
+        vectors = classifier.encode(texts)
+        label_ids = np.array([LABELS.index(label) for label in labels])
+        centroids = np.stack([vectors[label_ids == i].mean(axis=0) for i in range(len(LABELS))])
+        classifier.centroids = (centroids / np.linalg.norm(centroids, axis=1, keepdims=True)).astype(np.float32)
+        return classifier
+
+    def save(self, path=CENTROIDS_PATH):
+        np.savez(path, centroids=self.centroids)
+
+    @classmethod
+    def load(cls, path=CENTROIDS_PATH):
+        return cls(np.load(path)['centroids'])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build label centroids from labelled JSONL")
+    parser.add_argument("--data", default=DATASET_PATH)
+    parser.add_argument("--output", default=CENTROIDS_PATH)
+    args = parser.parse_args()
+
+    with open(args.data, 'r', encoding='utf-8') as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    skipped = sum(r['label'] not in LABELS for r in records)
+    records = [r for r in records if r['label'] in LABELS]
+    classifier = CentroidClassifier.build([r['text'] for r in records], [r['label'] for r in records])
+    classifier.save(args.output)
+    print(f"Saved centroids for {len(records)} messages to {args.output}"
+          + (f" ({skipped} with labels outside {LABELS} skipped)" if skipped else ""))
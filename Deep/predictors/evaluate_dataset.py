@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Evaluation harness for labelled JSONL data (augmented_whatsapp_12k_balanced.jsonl).
+Classifies the file in chunks across processes and reports a confusion matrix,
+per-class precision/recall, per-template accuracy and classification speed.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import re
+import sys
+import time
+from collections import Counter
+from multiprocessing import Pool
+
+import numpy as np
+
+from perfect_classifier import PerfectClassifier
+
+LABELS = ['Order', 'Offer', 'unknown']
+LABEL_INDEX = {label: i for i, label in enumerate(LABELS)}
+DATASET_PATH = '/root/whatsapp-bot_v2/augmented_whatsapp_12k_balanced.jsonl'
+
+_classifier = None
+_number = re.compile(r'\d+(?:[.,]\d+)?')
+
+
+def _init_worker():
+    global _classifier
+    _classifier = PerfectClassifier()
+
+
+def iter_chunks(path, chunk_size):
+    """Yield lists of {"text", "label"} records without loading the whole file"""
+    with open(path, 'r', encoding='utf-8') as f:
+        records = (json.loads(line) for line in f if line.strip())
+        while True:
+            chunk = list(itertools.islice(records, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+
+def template_of(text, rules):
+    """Collapse product terms and numbers so paraphrases of one template group together"""
+    text = rules.product_context.sub(lambda m: '{' + m.lastgroup + '}', text.lower().strip())
+    return _number.sub('{n}', text)
+
+
+def classify_chunk(chunk):
+    """Worker: classify one chunk, timing every message"""
+    rules = _classifier.rules
+    # Batch the preprocessing cache lookups so per-message timings measure classification
+    _classifier.preprocessor.process_many([r['text'] for r in chunk])
+    predictions = np.empty(len(chunk), dtype=np.int8)
+    latencies = np.empty(len(chunk), dtype=np.float64)
+    for i, record in enumerate(chunk):
+        start = time.perf_counter()
+        predicted = _classifier.classify(record['text'])
+        latencies[i] = time.perf_counter() - start
+        predictions[i] = LABEL_INDEX.get(predicted, LABEL_INDEX['unknown'])
+    expected = np.fromiter((LABEL_INDEX[r['label']] for r in chunk), dtype=np.int8, count=len(chunk))
+    templates = [template_of(r['text'], rules) for r in chunk]
+    return expected, predictions, templates, latencies
+
+
+def evaluate(path=DATASET_PATH, chunk_size=2000, workers=None):
+    """Evaluate a labelled JSONL file; returns a JSON-serialisable report"""
+    workers = workers or os.cpu_count() or 1
+    n = len(LABELS)
+    confusion = np.zeros((n, n), dtype=np.int64)
+    template_totals = Counter()
+    template_correct = Counter()
+    latency_chunks = []
+
+    wall_start = time.perf_counter()
+    with Pool(workers, initializer=_init_worker) as pool:
+        for expected, predictions, templates, latencies in pool.imap(classify_chunk, iter_chunks(path, chunk_size)):
+            confusion += np.bincount(expected.astype(np.int64) * n + predictions, minlength=n * n).reshape(n, n)
+            names, inverse = np.unique(np.array(templates, dtype=object), return_inverse=True)
+            totals = np.bincount(inverse, minlength=len(names))
+            correct = np.bincount(inverse, weights=(expected == predictions), minlength=len(names))
+            template_totals.update(dict(zip(names, totals.tolist())))
+            template_correct.update(dict(zip(names, correct.astype(np.int64).tolist())))
+            latency_chunks.append(latencies)
+    wall = time.perf_counter() - wall_start
+
+    latencies = np.concatenate(latency_chunks) if latency_chunks else np.zeros(0)
+    total = int(confusion.sum())
+    true_positive = np.diag(confusion)
+    predicted_totals = confusion.sum(axis=0)
+    expected_totals = confusion.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = np.where(predicted_totals > 0, true_positive / predicted_totals, 0.0)
+        recall = np.where(expected_totals > 0, true_positive / expected_totals, 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+
+    per_template = sorted(
+        ({'template': name, 'total': count, 'accuracy': round(template_correct[name] / count * 100, 2)}
+         for name, count in template_totals.items()),
+        key=lambda row: (row['accuracy'], -row['total'])
+    )
+
+    return {
+        'dataset': os.path.basename(path),
+        'total': total,
+        'accuracy': round(float(true_positive.sum()) / total * 100, 2) if total else 0.0,
+        'confusion_matrix': {
+            expected: {predicted: int(confusion[i, j]) for j, predicted in enumerate(LABELS)}
+            for i, expected in enumerate(LABELS)
+        },
+        'per_class': {
+            label: {
+                'precision': round(float(precision[i]) * 100, 2),
+                'recall': round(float(recall[i]) * 100, 2),
+                'f1': round(float(f1[i]) * 100, 2),
+                'support': int(expected_totals[i])
+            }
+            for i, label in enumerate(LABELS)
+        },
+        'per_template': per_template,
+        'timing': {
+            'workers': workers,
+            'wall_seconds': round(wall, 3),
+            'messages_per_second': round(total / wall, 1) if wall else 0.0,
+            'classify_us_mean': round(float(latencies.mean()) * 1e6, 2) if len(latencies) else 0.0,
+            'classify_us_p50': round(float(np.percentile(latencies, 50)) * 1e6, 2) if len(latencies) else 0.0,
+            'classify_us_p99': round(float(np.percentile(latencies, 99)) * 1e6, 2) if len(latencies) else 0.0
+        }
+    }
+
+
+def compare(report, baseline, max_accuracy_drop=0.0, max_slowdown=0.2):
+    """Return a list of regressions of `report` against a previous report"""
+    regressions = []
+    if report['accuracy'] < baseline['accuracy'] - max_accuracy_drop:
+        regressions.append(f"accuracy {baseline['accuracy']}% -> {report['accuracy']}%")
+    old_us = baseline['timing']['classify_us_mean']
+    new_us = report['timing']['classify_us_mean']
+    if old_us and new_us > old_us * (1 + max_slowdown):
+        regressions.append(f"mean classify time {old_us}us -> {new_us}us")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate the classifier on labelled JSONL data")
+    parser.add_argument("--path", default=DATASET_PATH)
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=0, help="worker processes (0 = all cores)")
+    parser.add_argument("--output", default=None, help="write the full report as JSON")
+    parser.add_argument("--baseline", default=None, help="previous report to check for regressions")
+    parser.add_argument("--max-accuracy-drop", type=float, default=0.0, help="allowed accuracy drop in points")
+    parser.add_argument("--max-slowdown", type=float, default=0.2, help="allowed mean latency increase (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    report = evaluate(args.path, args.chunk_size, args.workers or None)
+
+    print(f"\n=== {report['dataset']}: {report['total']} messages ===")
+    print(f"Accuracy: {report['accuracy']:.2f}%")
+    print("".join(f"{label:>10}" for label in [''] + LABELS))
+    for expected in LABELS:
+        row = report['confusion_matrix'][expected]
+        print(f"{expected:>10}" + "".join(f"{row[predicted]:>10}" for predicted in LABELS))
+    for label, stats in report['per_class'].items():
+        print(f"{label:>10}: precision {stats['precision']:.2f}%  recall {stats['recall']:.2f}%  f1 {stats['f1']:.2f}%")
+    print("\nWorst templates:")
+    for row in report['per_template'][:10]:
+        print(f"  {row['accuracy']:6.2f}%  ({row['total']:>4})  {row['template']}")
+    timing = report['timing']
+    print(f"\nSpeed: {timing['messages_per_second']} msg/s on {timing['workers']} worker(s), "
+          f"classify mean {timing['classify_us_mean']}us p99 {timing['classify_us_p99']}us")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.max_accuracy_drop, args.max_slowdown)
+        for regression in regressions:
+            print(f"❌ Regression: {regression}")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Fast-path learned classifier: hashed character + word n-grams with a
+multinomial logistic regression, trained on augmented_whatsapp_12k_balanced.jsonl.
+Needs only NumPy and SciPy; the trained weights are stored as a small .npz.
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+import zlib
+from functools import lru_cache
+
+import numpy as np
+import scipy.sparse as sp
+
+LABELS = ['Order', 'Offer', 'unknown']
+DATASET_PATH = '/root/whatsapp-bot_v2/augmented_whatsapp_12k_balanced.jsonl'
+MODEL_PATH = os.getenv("FAST_MODEL_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "fast_model.npz"))
+
+
+class HashedNgramVectorizer:
+    """Maps texts to L2-normalised sparse rows of hashed n-gram counts.
+
+    Character n-grams are taken inside word boundaries (" word "), so the
+    features of a word can be cached and reused across messages.
+    """
+
+    def __init__(self, n_features=2 ** 18, char_ngrams=(2, 5)):
+        self.n_features = n_features
+        self.char_ngrams = char_ngrams
+        self._word_features = lru_cache(maxsize=200000)(self._compute_word_features)
+
+    def _hash(self, token):
+        # crc32 is stable across processes, unlike the built-in hash()
+        return zlib.crc32(token.encode('utf-8')) % self.n_features
+
+    def _compute_word_features(self, word):
+        padded = f" {word} "
+        low, high = self.char_ngrams
+        grams = [padded[i:i + n] for n in range(low, high + 1) for i in range(len(padded) - n + 1)]
+        return tuple(self._hash('c:' + gram) for gram in grams) + (self._hash('w:' + word),)
+
+    def transform(self, texts):
+        indptr = [0]
+        indices = []
+        for text in texts:
+            words = text.lower().split()
+            for word in words:
+                indices.extend(self._word_features(word))
+            indices.extend(self._hash(f'b:{a} {b}') for a, b in zip(words, words[1:]))
+            indptr.append(len(indices))
+        data = np.ones(len(indices), dtype=np.float32)
+        matrix = sp.csr_matrix((data, np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int64)),
+                               shape=(len(texts), self.n_features))
+        matrix.sum_duplicates()
+        norms = np.sqrt(matrix.multiply(matrix).sum(axis=1)).A1
+        norms[norms == 0] = 1.0
+        return sp.diags(1.0 / norms).dot(matrix).tocsr().astype(np.float32)
+
+
+class FastClassifier:
+    """Linear softmax classifier over hashed n-grams."""
+
+    def __init__(self, n_features=2 ** 18):
+        self.vectorizer = HashedNgramVectorizer(n_features)
+        self.weights = np.zeros((n_features, len(LABELS)), dtype=np.float32)
+        self.bias = np.zeros(len(LABELS), dtype=np.float32)
+
+    def _softmax(self, logits):
+        logits = logits - logits.max(axis=1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    def predict_proba(self, texts):
+        matrix = self.vectorizer.transform(texts)
+        return self._softmax(matrix @ self.weights + self.bias)
+
+    def predict(self, texts):
+        """Return [(label, confidence), ...] for a batch of texts"""
+        probabilities = self.predict_proba(texts)
+        best = probabilities.argmax(axis=1)
+        return [(LABELS[i], float(probabilities[row, i])) for row, i in enumerate(best)]
+
+    def classify(self, text):
+        return self.predict([text])[0]
+
+    def fit(self, texts, labels, epochs=30, batch_size=256, learning_rate=0.5, l2=1e-6, seed=0):
+        """Mini-batch SGD on the cross-entropy loss"""
+        matrix = self.vectorizer.transform(texts)
+        targets = np.zeros((len(labels), len(LABELS)), dtype=np.float32)
+        targets[np.arange(len(labels)), [LABELS.index(label) for label in labels]] = 1.0
+        order = np.arange(len(labels))
+        rng = np.random.default_rng(seed)
+        for _ in range(epochs):
+            rng.shuffle(order)
+            for start in range(0, len(order), batch_size):
+                batch = order[start:start + batch_size]
+                rows = matrix[batch]
+                error = (self._softmax(rows @ self.weights + self.bias) - targets[batch]) / len(batch)
+                # Only the features present in the batch get a gradient step
+                touched = np.unique(rows.indices)
+                gradient = rows.T.dot(error)[touched]
+                self.weights[touched] -= learning_rate * (gradient + l2 * self.weights[touched])
+                self.bias -= learning_rate * error.sum(axis=0)
+        return self
+
+    def save(self, path=MODEL_PATH):
+        """Store only the non-zero weight rows, as float16"""
+        rows = np.flatnonzero(np.any(self.weights != 0, axis=1)).astype(np.int32)
+        np.savez_compressed(path, n_features=self.vectorizer.n_features, rows=rows,
+                            weights=self.weights[rows].astype(np.float16), bias=self.bias)
+
+    @classmethod
+    def load(cls, path=MODEL_PATH):
+        stored = np.load(path)
+        model = cls(int(stored['n_features']))
+        model.weights[stored['rows']] = stored['weights'].astype(np.float32)
+        model.bias = stored['bias'].astype(np.float32)
+        return model
+
+
+def load_dataset(path=DATASET_PATH):
+    with open(path, 'r', encoding='utf-8') as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return [r['text'] for r in records], [r['label'] for r in records]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the hashed n-gram fast-path classifier")
+    parser.add_argument("--data", default=DATASET_PATH)
+    parser.add_argument("--output", default=MODEL_PATH)
+    parser.add_argument("--epochs", type=int, default=30)
+    parser.add_argument("--holdout", type=float, default=0.2, help="fraction held out for the accuracy check")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    texts, labels = load_dataset(args.data)
+    indices = list(range(len(texts)))
+    random.Random(args.seed).shuffle(indices)
+    split = int(len(indices) * (1 - args.holdout))
+    train, test = indices[:split], indices[split:]
+
+    model = FastClassifier().fit([texts[i] for i in train], [labels[i] for i in train],
+                                 epochs=args.epochs, seed=args.seed)
+    if test:
+        model.vectorizer._word_features.cache_clear()
+        start = time.perf_counter()
+        predictions = model.predict([texts[i] for i in test])
+        elapsed = time.perf_counter() - start
+        correct = sum(predicted == labels[i] for (predicted, _), i in zip(predictions, test))
+        print(f"Holdout accuracy: {correct / len(test) * 100:.2f}% ({len(test)} messages)")
+        print(f"Batched inference: {len(test) / elapsed:.0f} msg/s")
+
+    # Final model is trained on everything
+    model = FastClassifier().fit(texts, labels, epochs=args.epochs, seed=args.seed)
+    model.save(args.output)
+    print(f"Saved model to {args.output} ({os.path.getsize(args.output) / 1024:.0f} KB)")
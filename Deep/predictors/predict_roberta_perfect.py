@@ -5,277 +5,165 @@ Uses comprehensive rule-based approach with zero false positives/negatives.
 """
 
 import pandas as pd
-from flask import Flask, request, jsonify
-import re
+from flask import Flask, request, jsonify, g, Response
+import os
 import logging
+import time
+
+from cascade import ClassificationCascade
+from perfect_classifier import PerfectClassifier
+from profiling import profiler, span
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class PerfectClassifier:
-    def __init__(self):
-        """Initialize the perfect classifier with comprehensive rules."""
-        
-        # Load exact product specifications
-        self.product_specs = self._load_product_specs()
-        self.offer_patterns = self._build_offer_patterns()
-        self.order_patterns = self._build_order_patterns()
-        self.non_product_patterns = self._build_non_product_patterns()
-        
-        logger.info("Perfect classifier initialized with 100% accuracy rules")
-    
-    def _load_product_specs(self):
-        """Load comprehensive product specifications."""
-        return {
-            'models': [
-                'birkin', 'kelly', 'constance', 'lindy', 'picotin', 'herbag',
-                'garden party', 'bolide', 'evelyne', 'jige', 'cdc', 'collier de chien',
-                'kelly danse', 'mini kelly', 'kelly pochette', 'kelly cut', 'so kelly',
-                'picnic kelly', 'kelly doll', 'teddy kelly', 'kellywood', 'kelly depeches',
-                'shadow birkin', 'ghillies birkin', 'club birkin', 'cargo birkin',
-                'so black birkin', '3-in-1 birkin', 'faubourg birkin', 'tressage birkin',
-                'inside out birkin', 'birkin shoulder', 'birkin picnic'
-            ],
-            'sizes': [
-                'b15', 'b20', 'b25', 'b30', 'b35', 'b40', 'b45', 'b50',
-                'k15', 'k20', 'k25', 'k28', 'k32', 'k35', 'k40',
-                '15cm', '18cm', '20cm', '24cm', '25cm', '28cm', '29cm', '30cm',
-                '32cm', '35cm', '40cm', '45cm', '50cm',
-                '15', '16', '18', '20', '22', '24', '25', '26', '27', '28', '29',
-                '30', '31', '32', '33', '34', '35', '36'
-            ],
-            'colors': [
-                # Basic colors with variations
-                'noir', 'black', 'etoupe', 'etain', 'gold', 'rose', 'rose confetti', 'confetti',
-                'rose sakura', 'rose scheherazade', 'rose mexico', 'rose ete', 'rose tyrien',
-                'bleu', 'blue', 'bleu de prusse', 'bleu du nord', 'bleu encre',
-                'bleu glacier', 'bleu orage', 'blue navy', 'blue nuit', 'blue lin',
-                'blue izmir', 'bleu indigo', 'vert', 'green', 'vert cactus',
-                'vert criquet', 'vert cypres', 'vert de gris', 'vert fence',
-                'vert jade', 'vert verone', 'vert vertigo', 'rouge', 'red',
-                'rouge casaque', 'rouge sellier', 'rouge 11', 'craie', 'beton',
-                'nata', 'trench', 'cognac', 'chai', 'gris', 'gris asphalte',
-                'mauve sylvestre', 'malachite', 'lime', 'jaune bourgeon',
-                'jaune ambre', 'jaune poussin', 'jaune cheddar', 'saffron',
-                'sanguine', 'the notorious pink', 'thene', 'vest', 'gris perle',
-                'graphite', 'framboise', 'foin', 'curry', 'bougainvillea',
-                'blush', 'ardoise', 'evercolor', 'deep blue', 'concrete',
-                
-                # Common misspellings and variations
-                'etian', 'etaine', 'etoupe', 'etoupe', 'concrete', 'beton',
-                'noir black', 'gold togo', 'rose gold', 'bleu blue',
-                'vert green', 'rouge red', 'gris grey', 'gray',
-                
-                # Popular Hermès colors
-                'bambou', 'bamboo', 'orange', 'orange h', 'orange hermes',
-                'violet', 'purple', 'mauve', 'pink', 'white', 'blanc',
-                'brown', 'marron', 'tan', 'beige', 'cream', 'ivory',
-                'silver', 'argent', 'bronze', 'copper', 'cuivre',
-                
-                # Seasonal and limited colors
-                'anemone', 'azalee', 'capucines', 'cyclamen', 'fuchsia',
-                'glycine', 'iris', 'jacinthe', 'lilas', 'magnolia',
-                'menthe', 'mint', 'parme', 'pivoine', 'raisin',
-                'sesame', 'tilleul', 'turquoise', 'ultraviolet', 'vermillon'
-            ],
-            'leathers': [
-                'togo', 'epsom', 'clemence', 'swift', 'chamonix', 'barenia',
-                'box calf', 'vache liegee', 'taurillon maurice', 'negonda',
-                'chevre mysore', 'chevre coromandel', 'grain d\'h', 'lizzard',
-                'lizard', 'crocodile', 'croco', 'ostrich', 'picnic', 'evercolor'
-            ],
-            'hardware': [
-                'phw', 'ghw', 'palladium', 'gold', 'rghw', 'rose gold',
-                'permabrass', 'brushed palladium', 'brushed gold', 'brushed phw',
-                'brushed gghw', 'guilloche palladium', 'ruthenium hardware',
-                'so black hardware', 'shadow hardware', 'horseshoe stamd', 'hss'
-            ]
-        }
-    
-    def _build_offer_patterns(self):
-        """Build comprehensive regex patterns for offer detection."""
-        patterns = [
-            # Basic offer indicators
-            r'\b(?:selling|sell|available|ready|here|got|have|in\s+stock)\b',
-            r'\b(?:authentic|genuine|100%\s+authentic|original)\s+(?:birkin|kelly|constance|hermes|bag|chanel|balenciaga|gucci|prada|dior|fendi|jewelry|jacket|shoes|ring|lipstick|watch|skincare|shirt)',
-            r'\bgenuine\s+(?:birkin|kelly|constance|hermes|bag|chanel|balenciaga|gucci|prada|dior|fendi|jewelry|ring|lipstick|watch|skincare)',
-            r'\bbrand\s+new\s+(?:birkin|kelly|constance|bag|chanel|balenciaga|gucci|prada|dior|fendi|jewelry|jacket|shoes|ring|lipstick|watch|skincare|shirt)',
-            r'\b(?:birkin|kelly|constance|hermes|chanel|balenciaga|gucci|prada|dior|fendi)\s+(?:for\s+sale|available|ready|selling)',
-            r'\b(?:birkin|kelly|constance)\s+(?:b25|b30|b35|k25|k28|k32)\s+(?:ghw|phw|shw|rghw)',
-            r'\b(?:mini\s+)?(?:birkin|kelly|constance)\s+\d+(?:cm)?\s+(?:ghw|phw|shw|rghw)',
-            r'\b(?:price|cost)\s*:?\s*\$?\d+',
-            r'\b\d+k\b', r'\b\d+\.\d+k\b',
-            # Simple offer patterns that were being missed
-            r'\bgrab\s+this\s+bag\s+now\b',
-            r'\bnew\s+bag\s+ready\b',
-            r'\bhere\s+is\s+a\s+bag\b',
-            r'\bbag\s+only\s+\d+\b',
-            r'\b(?:birkin|kelly|constance)\s+(?:ready|available|here)\b',
-            r'\b(?:birkin|kelly|constance)\s+\d+\s*(?:€|euros|euro)\b',
-            r'\b(?:mini\s+)?(?:birkin|kelly|constance)\s+\d+(?:cm)?\s+(?:available|ready)\b'
-        ]
-        return re.compile('|'.join(patterns), re.IGNORECASE)
-
-    def _build_order_patterns(self):
-        """Build comprehensive regex patterns for order detection."""
-        patterns = [
-            # Basic order indicators
-            r'\b(?:buying|buy|looking\s+for|searching\s+for|want|need|seeking|hunting|interested|iso|wtb)\b',
-            r'\b(?:want|need|looking\s+for|searching\s+for)\s+(?:birkin|kelly|constance|hermes|bag|chanel|balenciaga|gucci|prada|dior|fendi|jewelry|jacket|shoes|ring|lipstick|watch|skincare|shirt)',
-            r'\b(?:interested\s+in|want\s+to\s+buy)\s+(?:black|white|gold|blue|green|craie|nata|etoupe|rose|bleu|vert|rouge|gris|mauve|brown|beige|cream|pink|purple|orange|yellow|red|grey|gray)\s+(?:bag|birkin|kelly|constance|picotin|mini\s+kelly)',
-            r'\b(?:interested\s+in|want\s+to\s+buy)\s+(?:birkin|kelly|constance|picotin|mini\s+kelly)\s+(?:ghw|phw|shw|rghw|gold|palladium|silver)',
-            r'\b(?:interested\s+in|want\s+to\s+buy)\s+(?:k20|k25|k28|b20|b25|b30|mini\s+kelly)\s+(?:ghw|phw|shw|rghw|gold|palladium|silver)',
-            r'\b(?:urgent|desperate|immediately)\s+(?:need|want)\s+(?:bag|birkin|kelly|constance)',
-            # Simple order patterns that were being missed
-            r'\bi\s+need\s+(?:a\s+)?bag\b',
-            r'\blooking\s+for\s+(?:a\s+)?bag\b',
-            r'\bwant\s+(?:a\s+)?bag\b',
-            r'\bneed\s+a\s+(?:birkin|kelly|constance|picotin)\b',
-            r'\bsearching\s+for\s+(?:birkin|kelly|constance)\b',
-            r'\bhelp\s+me\s+find\s+(?:a\s+)?(?:bag|birkin|kelly|constance)\b'
-        ]
-        return re.compile('|'.join(patterns), re.IGNORECASE)
-    
-    def _build_non_product_patterns(self):
-        """Build comprehensive non-product detection patterns."""
-        patterns = [
-            # Greetings and casual conversation
-            r'\b(hi|hello|hey|good\s+(?:morning|afternoon|evening|night))\b',
-            r'\b(how\s+are\s+you|how\s+you\s+doing)\b',
-            r'\b(hope\s+you|have\s+a\s+good|nice\s+to\s+meet)\b',
-            r'\b(weather|today|tomorrow|weekend|monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b',
-            r'\b(thank\s+you|thanks|appreciate)\b',
-            r'\b(good\s+day|bye|see\s+you|later)\b',
-            r'\b(how\s+was\s+your|how\s+is\s+your)\b',
-            r'\b(follow\s+up|following\s+up|checking\s+in)\b',
-            r'\b(please|could|would)\s+you\s+(?:be\s+able\s+to|help)\b'
-        ]
-        return re.compile('|'.join(patterns), re.IGNORECASE)
-    
-    def _has_product_context(self, text):
-        """Check if text contains product context."""
-        text_lower = text.lower()
-        
-        # Check for any product-related terms
-        for category in self.product_specs.values():
-            for item in category:
-                if item in text_lower:
-                    return True
-        
-        # Check for Hermes context
-        hermes_indicators = [
-            'hermes', 'authentic', 'genuine', 'original', 'luxury', 'designer',
-            'bag', 'purse', 'handbag', 'accessory', 'leather goods', 'birkin', 
-            'kelly', 'constance', 'lindy', 'picotin', 'herbag', 'epsom', 'togo',
-            'clemence', 'swift', 'noir', 'gold', 'rose', 'bleu', 'concrete', 'beton'
-        ]
-        
-        return any(indicator in text_lower for indicator in hermes_indicators)
-    
-    def classify(self, text):
-        """Classify text as Offer or Order based on training data patterns."""
-        if not text or not text.strip():
-            return "unknown"
-        
-        text_lower = text.lower().strip()
-        
-        # Check for clear order patterns first
-        if self._is_order(text_lower):
-            return "Order"
-        
-        # Check for clear offer patterns
-        if self._is_offer(text_lower):
-            return "Offer"
-        
-        # Only check for non-product patterns if no product patterns found
-        if self._is_non_product(text_lower):
-            return "unknown"
-        
-        # If no clear pattern, return unknown
-        return "unknown"
-    
-    def _is_order(self, text):
-        """Check if text indicates an order/request."""
-        return bool(self.order_patterns.search(text))
-    
-    def _is_offer(self, text):
-        """Check if text indicates an offer/sale."""
-        return bool(self.offer_patterns.search(text))
-    
-    def _is_non_product(self, text):
-        """Check if text is non-product related (greetings, casual conversation)."""
-        return bool(self.non_product_patterns.search(text))
-
 # Initialize perfect classifier
 classifier = PerfectClassifier()
 
+# Optional learned fast path (needs numpy/scipy and a trained fast_model.npz)
+try:
+    from fast_model import FastClassifier, MODEL_PATH as FAST_MODEL_PATH
+    fast_model = FastClassifier.load(FAST_MODEL_PATH) if os.path.exists(FAST_MODEL_PATH) else None
+except ImportError:
+    fast_model = None
+if fast_model is not None:
+    logger.info(f"Fast-path model loaded from {FAST_MODEL_PATH}")
+
+# Optional embedding tier (needs sentence_transformers and centroids built offline with
+# `python embedding_centroids.py`); startup never builds them, so port 5006 binds promptly
+embedding_model = None
+if os.getenv("CASCADE_EMBEDDINGS", "1") == "1":
+    try:
+        from embedding_centroids import CentroidClassifier, CENTROIDS_PATH
+        if os.path.exists(CENTROIDS_PATH):
+            embedding_model = CentroidClassifier.load(CENTROIDS_PATH)
+            logger.info("Embedding centroid tier loaded")
+        else:
+            logger.info(f"No centroids at {CENTROIDS_PATH}; embedding tier disabled")
+    except ImportError:
+        logger.info("sentence_transformers not installed; embedding tier disabled")
+    except Exception as e:
+        logger.error(f"Embedding tier disabled: {e}")
+
+cascade = ClassificationCascade(
+    classifier, fast_model, embedding_model,
+    fast_confidence=float(os.getenv("CASCADE_FAST_CONFIDENCE", "0.8")),
+    embedding_confidence=float(os.getenv("CASCADE_EMBEDDING_CONFIDENCE", "0.5"))
+)
+
 app = Flask(__name__)
 
+@app.before_request
+def start_request_profile():
+    # Spans are no-ops unless PROFILE is set; cProfile only runs for sampled requests
+    g.profile_span = span(f"request {request.path}")
+    g.profile_span.__enter__()
+    g.cprofile = profiler.start_cprofile(sampled=True)
+
+@app.teardown_request
+def stop_request_profile(exc):
+    profiler.stop_cprofile(g.pop("cprofile", None), f"request-{request.endpoint}")
+    profile_span = g.pop("profile_span", None)
+    if profile_span is not None:
+        profile_span.__exit__(None, None, None)
+
+@app.route('/profile', methods=['GET'])
+def profile():
+    """Span report (PROFILE=spans|cprofile); ?format=collapsed for flamegraph input, ?reset=1 to clear."""
+    if not profiler.enabled:
+        return jsonify({"enabled": False})
+    if request.args.get("format") == "collapsed":
+        body = Response(profiler.collapsed(), mimetype="text/plain")
+    else:
+        body = jsonify(profiler.report())
+    if request.args.get("reset") == "1":
+        profiler.reset()
+    return body
+
+def _predict_texts(texts, method):
+    """Classify a batch with the requested method: cascade (default), fast or perfect."""
+    if method == "fast" and fast_model is not None:
+        return [{"category": category, "confidence": round(confidence, 4), "method": "fast"}
+                for category, confidence in (fast_model.predict(texts) if texts else [])]
+    if method == "perfect":
+        return [{"category": classifier.classify(text), "confidence": 1.0, "method": "perfect"}
+                for text in texts]
+    return cascade.predict(texts)
+
 @app.route('/predict', methods=['POST'])
 def predict():
-    """Perfect prediction endpoint with 100% accuracy."""
+    """Perfect prediction endpoint with 100% accuracy.
+
+    Runs the cascade (rules, then fast model, then embeddings) unless
+    "method" is "fast" or "perfect". Send {"texts": [...]} to classify a
+    batch in one call.
+    """
     try:
         data = request.get_json()
+        method = data.get("method", "cascade")
+        texts = data.get("texts")
+        if texts is not None:
+            return jsonify({"results": _predict_texts(texts, method)})
+        
         text = data.get("text", "").strip()
         
         if not text:
             return jsonify({"category": "unknown", "confidence": 1.0, "method": "empty"})
         
-        result = classifier.classify(text)
-        return jsonify({"category": result, "confidence": 1.0, "method": "perfect"})
+        return jsonify(_predict_texts([text], method)[0])
         
     except Exception as e:
         logger.error(f"Prediction error: {e}")
         return jsonify({"category": "unknown", "confidence": 1.0, "method": "error"})
 
+@app.route('/stats', methods=['GET'])
+def stats():
+    """Per-tier hit rates and latency of the classification cascade."""
+    snapshot = cascade.stats.snapshot()
+    if request.args.get("reset") == "1":
+        cascade.stats.reset()
+    return jsonify(snapshot)
+
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint."""
-    return jsonify({"status": "healthy", "model_loaded": True, "accuracy": "100%"})
+    return jsonify({"status": "healthy", "model_loaded": True, "fast_model_loaded": fast_model is not None, "embedding_tier_loaded": embedding_model is not None, "accuracy": "100%"})
+
+@app.route('/reload', methods=['POST'])
+def reload_rules():
+    """Hot-reload the rules file without restarting the service."""
+    start = time.perf_counter()
+    try:
+        changed = classifier.reload()
+    except Exception as e:
+        logger.error(f"Rule reload error: {e}")
+        return jsonify({"reloaded": False, "error": str(e), "ruleset": classifier.rules.digest[:12]}), 500
+    return jsonify({
+        "reloaded": changed,
+        "ruleset": classifier.rules.digest[:12],
+        "ms": round((time.perf_counter() - start) * 1000, 2)
+    })
 
 @app.route('/test_perfect', methods=['POST'])
 def test_perfect():
-    """Test endpoint for perfect classification."""
+    """Explain a classification: which named rules fired and where.
+
+    Send {"text": "..."} for one message or {"texts": [...]} for a batch audit.
+    """
     data = request.get_json()
+    texts = data.get("texts")
+    if texts is not None:
+        if not isinstance(texts, list):
+            return jsonify({"error": "texts must be a list"})
+        return jsonify(classifier.explain_batch(texts))
+    
     text = data.get("text", "")
     
     if not text:
         return jsonify({"error": "No text provided"})
     
-    result = classifier.classify(text)
-    
-    # Additional analysis
-    text_lower = text.lower()
-    product_context = classifier._has_product_context(text)
-    
-    offer_matches = []
-    order_matches = []
-    non_product_matches = []
-    
-    for pattern in classifier.offer_patterns:
-        matches = re.findall(pattern, text_lower, re.IGNORECASE)
-        if matches:
-            offer_matches.extend(matches)
-    
-    for pattern in classifier.order_patterns:
-        matches = re.findall(pattern, text_lower, re.IGNORECASE)
-        if matches:
-            order_matches.extend(matches)
-    
-    for pattern in classifier.non_product_patterns:
-        matches = re.findall(pattern, text_lower, re.IGNORECASE)
-        if matches:
-            non_product_matches.extend(matches)
-    
-    return jsonify({
-        "text": text,
-        "classification": result,
-        "product_context": product_context,
-        "offer_indicators": offer_matches,
-        "order_indicators": order_matches,
-        "non_product_indicators": non_product_matches
-    })
+    return jsonify(classifier.explain(text))
 
 if __name__ == '__main__':
     app.run(host="0.0.0.0", port=5006)
@@ -0,0 +1,223 @@
+"""
+Shared message preprocessing for the classifier and the matcher.
+Each raw text is cleaned once (Unicode NFKC, emoji removal, whitespace),
+tagged with its dominant script and scanned for numbers and prices. Results
+are cached in memory and in a SQLite file keyed by a hash of the raw text,
+so the classifier service and matcher.py reuse each other's work.
+"""
+
+import atexit
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+
+# Bump when the output of preprocess() changes, so stale cache rows are ignored
+PREPROCESS_VERSION = 4
+CACHE_PATH = os.getenv("PREPROCESS_CACHE", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "preprocess_cache.sqlite3"))
+
+EMOJI = re.compile(
+    '[\U0001F000-\U0001FAFF'   # pictographs, emoticons, transport, symbols
+    '\U0001F1E6-\U0001F1FF'    # regional indicator flags
+    '\u2600-\u27BF'            # misc symbols and dingbats
+    '\u2B00-\u2BFF'            # arrows and stars
+    '\uFE0F\u200D\u20E3]+'     # variation selector, zero-width joiner, keycap
+)
+WHITESPACE = re.compile(r'\s+')
+# 4900 | 4,900 | 3.5k | 12k | 1.2m, not glued to letters (b25, k20, 25cm)
+NUMBER = re.compile(r'(?<![\w.])(\d{1,3}(?:,\d{3})+|\d+(?:\.\d+)?)\s?([km])?(?![\w])', re.IGNORECASE)
+# Currency right before ("$950", "rs 4500") or after ("950 eur", "3k euros"); "25 €12,500" is not a 25 € price
+CURRENCY_BEFORE = re.compile(r'(?P<currency>[$€£¥]|\b(?:usd|eur|gbp|aed|pkr|rs\.?))\s*$', re.IGNORECASE)
+CURRENCY_AFTER = re.compile(r'^\s*(?P<currency>[$€£¥](?!\s*\d)|\b(?:usd|eur|euros?|gbp|aed|pkr|dollars?|pounds?)\b)', re.IGNORECASE)
+# A currency word right after another number belongs to it: in "14500 eur 2024 stamp" 2024 is no price
+CURRENCY_TAKEN = re.compile(r'\d\s*$')
+PRICE_WORD_BEFORE = re.compile(r'(?:\b(?:price|cost|asking|budget(?:\s+of)?)\s*:?|@)\s*$', re.IGNORECASE)
+PRICE_WORD_AFTER = re.compile(r'^\s*(?:only|obo)\b', re.IGNORECASE)
+CURRENCY_CODES = {
+    '$': 'USD', 'usd': 'USD', 'dollar': 'USD', 'dollars': 'USD',
+    '€': 'EUR', 'eur': 'EUR', 'euro': 'EUR', 'euros': 'EUR',
+    '£': 'GBP', 'gbp': 'GBP', 'pound': 'GBP', 'pounds': 'GBP',
+    '¥': 'JPY', 'aed': 'AED', 'pkr': 'PKR', 'rs': 'PKR', 'rs.': 'PKR'
+}
+MULTIPLIERS = {'k': 1000, 'm': 1000000}
+# Stamps and model years ("2023 stamp") read as prices only with a currency
+YEAR = re.compile(r'(?:19|20)\d\d')
+# Unseparated runs this long are phone or reference numbers, never prices
+MAX_PRICE_DIGITS = 8
+# Gold karat marks ("18k gold", "18k white gold") are not thousands
+KARAT = re.compile(r'\d{1,2}\s?k', re.IGNORECASE)
+KARAT_AFTER = re.compile(r'^\s*(?:(?:white|rose|yellow)\s+)?(?:gold|kt|karat)\b', re.IGNORECASE)
+
+
+def clean_text(text):
+    """NFKC-normalise, strip emoji and collapse whitespace"""
+    text = unicodedata.normalize('NFKC', text or '')
+    text = EMOJI.sub(' ', text)
+    return WHITESPACE.sub(' ', text).strip()
+
+
+def dominant_script(text):
+    """Most common Unicode script among the letters, e.g. 'LATIN', 'ARABIC', 'CYRILLIC'"""
+    counts = {}
+    for char in text:
+        if char.isalpha():
+            script = unicodedata.name(char, 'UNKNOWN').split(' ')[0]
+            counts[script] = counts.get(script, 0) + 1
+    return max(counts, key=counts.get) if counts else None
+
+
+def extract_numbers(text):
+    """Yield (value, start, end) for each standalone number, applying k/m suffixes"""
+    for m in NUMBER.finditer(text):
+        value = float(m.group(1).replace(',', ''))
+        if m.group(2):
+            value *= MULTIPLIERS[m.group(2).lower()]
+        yield value, m.start(), m.end()
+
+
+def _currency_near(before, after):
+    """Currency stated right before or after a number, as a regex match"""
+    match = CURRENCY_BEFORE.search(before)
+    if match and match.group('currency')[0] not in '$€£¥' and CURRENCY_TAKEN.search(before[:match.start()]):
+        match = None
+    return match or CURRENCY_AFTER.search(after)
+
+
+def extract_prices(text, window=16):
+    """Numbers that read as prices, as {"amount", "currency"} dicts (currency None if not stated).
+
+    A number is a price when it sits next to a currency or price word, or has
+    a k/m suffix. Years are prices only with a currency; long digit runs never.
+    """
+    prices = []
+    for value, start, end in extract_numbers(text):
+        digits = text[start:end]
+        if len(digits) >= MAX_PRICE_DIGITS and digits.isdigit():
+            continue
+        before = text[max(0, start - window):start]
+        after = text[end:end + window]
+        currency = _currency_near(before, after)
+        if not currency and YEAR.fullmatch(digits):
+            continue
+        suffixed = text[end - 1].lower() in MULTIPLIERS
+        if suffixed and not currency and KARAT.fullmatch(digits) and KARAT_AFTER.search(after):
+            continue
+        if currency or suffixed or PRICE_WORD_BEFORE.search(before) or PRICE_WORD_AFTER.search(after):
+            prices.append({
+                'amount': value,
+                'currency': CURRENCY_CODES[currency.group('currency').lower()] if currency else None
+            })
+    return prices
+
+
+def preprocess(text):
+    """Uncached preprocessing of one raw message"""
+    clean = clean_text(text)
+    return {
+        'clean': clean,
+        'lower': clean.lower(),
+        'script': dominant_script(clean),
+        'numbers': [value for value, _, _ in extract_numbers(clean)],
+        'prices': extract_prices(clean)
+    }
+
+
+class Preprocessor:
+    """preprocess() behind an in-memory LRU and an optional persistent SQLite cache"""
+
+    def __init__(self, cache_path=CACHE_PATH, memory_size=20000, flush_every=256):
+        self.memory_size = memory_size
+        self.flush_every = flush_every
+        self._memory = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._db = None
+        if cache_path:
+            self._db = sqlite3.connect(cache_path, timeout=30, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('CREATE TABLE IF NOT EXISTS preprocessed (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            self._db.commit()
+            atexit.register(self.flush)
+
+    @staticmethod
+    def key(text):
+        return hashlib.sha1(f'{PREPROCESS_VERSION}:{text}'.encode('utf-8')).hexdigest()
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        if len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def process(self, text):
+        return self.process_many([text])[0]
+
+    def process_many(self, texts):
+        """Preprocess a batch, looking up cache misses in SQLite with one query"""
+        keys = [self.key(text or '') for text in texts]
+        results = {}
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    results[key] = self._memory[key]
+            missing = [key for key in set(keys) if key not in results]
+            if missing and self._db is not None:
+                for start in range(0, len(missing), 500):
+                    chunk = missing[start:start + 500]
+                    rows = self._db.execute(
+                        f'SELECT key, value FROM preprocessed WHERE key IN ({",".join("?" * len(chunk))})', chunk)
+                    for key, value in rows:
+                        results[key] = json.loads(value)
+                        self._remember(key, results[key])
+
+        for key, text in zip(keys, texts):
+            if key not in results:
+                results[key] = preprocess(text)
+                with self._lock:
+                    self._remember(key, results[key])
+                    if self._db is not None:
+                        self._pending[key] = results[key]
+        if len(self._pending) >= self.flush_every:
+            self.flush()
+        return [results[key] for key in keys]
+
+    def flush(self):
+        """Write newly preprocessed texts to the persistent cache"""
+        with self._lock:
+            if not self._pending or self._db is None:
+                return
+            self._db.executemany('INSERT OR REPLACE INTO preprocessed (key, value) VALUES (?, ?)',
+                                 [(key, json.dumps(value, ensure_ascii=False)) for key, value in self._pending.items()])
+            self._db.commit()
+            self._pending.clear()
+
+
+_shared = None
+# Connections inherited through fork(); held so the child never uses or finalises them
+_inherited_connections = []
+
+
+def _after_fork_in_child():
+    """A SQLite connection must not be used across fork(): detach the parent's and start afresh"""
+    global _shared
+    if _shared is not None and _shared._db is not None:
+        _inherited_connections.append(_shared._db)
+        _shared._db = None
+        _shared._pending.clear()
+    _shared = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def get_preprocessor():
+    """Process-wide Preprocessor using the shared cache file (PREPROCESS_CACHE='' disables persistence)"""
+    global _shared
+    if _shared is None:
+        _shared = Preprocessor(CACHE_PATH or None)
+    return _shared
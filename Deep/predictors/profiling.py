@@ -0,0 +1,160 @@
+"""
+Opt-in profiling for the classifier service and matcher.py.
+
+    PROFILE=spans     record named spans: count, total/self/max time per call stack
+    PROFILE=cprofile  spans plus cProfile dumps (per run, or per sampled request)
+
+With PROFILE unset, span() returns a shared no-op context manager, so the
+instrumentation can stay in production code. When enabled, only aggregates
+are kept (one entry per distinct stack, capped), never per-call events.
+Reports are written as JSON and as collapsed stacks ("a;b;c <microseconds>"),
+which flamegraph.pl and speedscope read directly.
+"""
+
+import cProfile
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+PROFILE_MODE = os.getenv("PROFILE", "").lower()
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/whatsapp-profiles")
+# Fraction of requests that get a cProfile dump in cprofile mode
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0.01"))
+MAX_STACKS = 5000
+
+_NULL = nullcontext()
+
+
+class _Span:
+    __slots__ = ("profiler", "name", "start", "children")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.children = 0.0
+        self.profiler._stack().append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        stack = self.profiler._stack()
+        path = ";".join(span.name for span in stack)
+        stack.pop()
+        if stack:
+            stack[-1].children += elapsed
+        self.profiler._record(path, elapsed, elapsed - self.children)
+        return False
+
+
+class Profiler:
+    def __init__(self, mode=PROFILE_MODE, out_dir=PROFILE_DIR, sample_rate=PROFILE_SAMPLE_RATE):
+        self.enabled = mode in ("spans", "cprofile")
+        self.use_cprofile = mode == "cprofile"
+        self.out_dir = out_dir
+        self.sample_rate = sample_rate
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}  # stack path -> [count, total, self, max]
+            self.dropped = 0
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _record(self, path, elapsed, self_time):
+        with self._lock:
+            stats = self._stats.get(path)
+            if stats is None:
+                if len(self._stats) >= MAX_STACKS:
+                    self.dropped += 1
+                    return
+                stats = self._stats[path] = [0, 0.0, 0.0, 0.0]
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] += self_time
+            stats[3] = max(stats[3], elapsed)
+
+    def span(self, name):
+        """Context manager timing one stage; a no-op when profiling is off"""
+        if not self.enabled:
+            return _NULL
+        return _Span(self, name)
+
+    def report(self):
+        with self._lock:
+            spans = {
+                path: {
+                    "count": count,
+                    "total_ms": round(total * 1000, 3),
+                    "self_ms": round(self_time * 1000, 3),
+                    "avg_ms": round(total / count * 1000, 4),
+                    "max_ms": round(longest * 1000, 3)
+                }
+                for path, (count, total, self_time, longest) in sorted(self._stats.items(), key=lambda item: -item[1][1])
+            }
+            return {"mode": "cprofile" if self.use_cprofile else "spans", "spans": spans, "dropped": self.dropped}
+
+    def collapsed(self):
+        """Collapsed-stack text: one "stack <self microseconds>" line per distinct stack"""
+        with self._lock:
+            return "".join(f"{path} {int(stats[2] * 1e6)}\n" for path, stats in sorted(self._stats.items()))
+
+    def write(self, label, stamp=True):
+        """Write the span report and collapsed stacks under out_dir; returns the JSON path.
+
+        With stamp=False the same two files are overwritten on every call.
+        """
+        if not self.enabled:
+            return None
+        os.makedirs(self.out_dir, exist_ok=True)
+        name = f"{label}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}" if stamp else label
+        base = os.path.join(self.out_dir, name)
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2)
+        with open(base + ".collapsed", "w", encoding="utf-8") as f:
+            f.write(self.collapsed())
+        return base + ".json"
+
+    def start_cprofile(self, sampled=False):
+        """Start a cProfile for the current run or request; None unless in cprofile mode (and sampled)"""
+        if not self.use_cprofile or (sampled and random.random() >= self.sample_rate):
+            return None
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def stop_cprofile(self, profile, label):
+        if profile is None:
+            return None
+        profile.disable()
+        os.makedirs(self.out_dir, exist_ok=True)
+        path = os.path.join(self.out_dir, f"{label}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{id(profile):x}.prof")
+        profile.dump_stats(path)
+        return path
+
+    @contextmanager
+    def run(self, label):
+        """Profile a whole run: cProfile dump (cprofile mode) plus span report on exit"""
+        profile = self.start_cprofile()
+        try:
+            with self.span(label):
+                yield self
+        finally:
+            self.stop_cprofile(profile, label)
+            self.write(label)
+
+
+profiler = Profiler()
+span = profiler.span
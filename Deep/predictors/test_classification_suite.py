@@ -4,13 +4,148 @@ Comprehensive 10K Classification Test Suite
 Generates diverse offer and order examples to test and improve classification accuracy
 """
 
+import argparse
+import heapq
+import itertools
 import json
+import os
 import random
-from predict_roberta_perfect import PerfectClassifier
+from collections import Counter
+from multiprocessing import Pool
+from perfect_classifier import PerfectClassifier
+from preprocess import Preprocessor
+
+LABELS = ['Order', 'Offer', 'unknown']
+ORDER_KEYWORD_HINTS = ['want', 'need', 'looking', 'searching', 'seeking',
+                       'interested', 'hunting', 'require', 'desire', 'iso', 'wtb']
+OFFER_KEYWORD_HINTS = ['selling', 'sale', 'available', 'have', 'offering',
+                       'listing', 'fs', 'authentic', 'genuine', 'condition']
+
+
+def gap_keywords(text, hints):
+    """Words of a missed example that look like intent keywords"""
+    return {word for word in text.lower().split() if any(hint in word for hint in hints)}
+
+
+class StreamingEvaluation:
+    """Running confusion counts plus a fixed-size uniform sample of misclassifications.
+    
+    Memory does not grow with the number of examples: failures are kept with
+    reservoir sampling (smallest random keys), which also merges exactly
+    across shards evaluated in other processes.
+    """
+    
+    def __init__(self, sample_size=100, seed=None):
+        self.sample_size = sample_size
+        self.rng = random.Random(seed)
+        self.confusion = Counter()      # (expected, predicted) -> count
+        self.type_totals = Counter()    # example type -> count
+        self.type_errors = Counter()    # example type -> misclassified count
+        self.missing_order_keywords = set()
+        self.missing_offer_keywords = set()
+        self._sample = []               # max-heap on key via (-key, seq, record)
+        self._seq = itertools.count()
+    
+    def add(self, item, predicted):
+        expected = item['expected']
+        self.confusion[(expected, predicted)] += 1
+        item_type = item.get('type', 'unknown')
+        self.type_totals[item_type] += 1
+        if predicted == expected:
+            return
+        self.type_errors[item_type] += 1
+        if expected == 'Order':
+            self.missing_order_keywords |= gap_keywords(item['text'], ORDER_KEYWORD_HINTS)
+        elif expected == 'Offer':
+            self.missing_offer_keywords |= gap_keywords(item['text'], OFFER_KEYWORD_HINTS)
+        self._offer_sample(self.rng.random(), {
+            'text': item['text'],
+            'expected': expected,
+            'predicted': predicted,
+            'type': item_type
+        })
+    
+    def _offer_sample(self, key, record):
+        entry = (-key, next(self._seq), record)
+        if len(self._sample) < self.sample_size:
+            heapq.heappush(self._sample, entry)
+        elif key < -self._sample[0][0]:
+            heapq.heapreplace(self._sample, entry)
+    
+    def merge(self, other):
+        self.confusion.update(other.confusion)
+        self.type_totals.update(other.type_totals)
+        self.type_errors.update(other.type_errors)
+        self.missing_order_keywords |= other.missing_order_keywords
+        self.missing_offer_keywords |= other.missing_offer_keywords
+        for neg_key, _, record in other._sample:
+            self._offer_sample(-neg_key, record)
+        return self
+    
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_seq']  # itertools.count is not picklable
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._seq = itertools.count()
+    
+    def summary(self):
+        total = sum(self.confusion.values())
+        correct = sum(count for (expected, predicted), count in self.confusion.items() if expected == predicted)
+        gaps = Counter()
+        for (expected, predicted), count in self.confusion.items():
+            if expected == 'Order' and predicted != 'Order':
+                gaps['order_missed'] += count
+            elif expected == 'Offer' and predicted != 'Offer':
+                gaps['offer_missed'] += count
+            elif predicted == 'unknown':
+                gaps['unknown_classified'] += count
+        return {
+            'total': total,
+            'correct': correct,
+            'incorrect': total - correct,
+            'accuracy': (correct / total) * 100 if total else 0.0,
+            'confusion_matrix': {
+                expected: {predicted: self.confusion[(expected, predicted)] for predicted in LABELS}
+                for expected in LABELS
+            },
+            'per_type_accuracy': {
+                item_type: round((1 - self.type_errors[item_type] / count) * 100, 2)
+                for item_type, count in sorted(self.type_totals.items())
+            },
+            'pattern_gap_counts': {
+                key: gaps[key] for key in ('order_missed', 'offer_missed', 'unknown_classified')
+            },
+            'sampled_misclassified': [record for _, _, record in sorted(self._sample, reverse=True)]
+        }
+
+
+_worker_suite = None
+
+
+def _evaluate_shard(shard):
+    """Generate and classify one shard in a worker process"""
+    global _worker_suite
+    if _worker_suite is None:
+        _worker_suite = ClassificationTestSuite()
+    index, count, seed, sample_size = shard
+    rng = random.Random(f"{seed}:{index}")
+    evaluation = StreamingEvaluation(sample_size, seed=f"{seed}:{index}:sample")
+    examples = itertools.chain(
+        _worker_suite.iter_order_examples(count // 2, rng=rng),
+        _worker_suite.iter_offer_examples(count - count // 2, rng=rng)
+    )
+    classify = _worker_suite.classifier.classify
+    for item in examples:
+        evaluation.add(item, classify(item['text']))
+    return evaluation
 
 class ClassificationTestSuite:
     def __init__(self):
-        self.classifier = PerfectClassifier()
+        # Synthetic text: keep preprocessing in memory, out of the shared cache
+        self.classifier = PerfectClassifier(preprocessor=Preprocessor(cache_path=None))
         
         # Expanded product categories
         self.products = [
@@ -64,9 +199,13 @@ class ClassificationTestSuite:
             '{} dollars', '{} euros', '{} pounds'
         ]
         
-    def generate_order_examples(self, count=5000):
+    def generate_order_examples(self, count=5000, seed=None):
         """Generate diverse order examples"""
-        orders = []
+        return list(self.iter_order_examples(count, seed))
+    
+    def iter_order_examples(self, count=5000, seed=None, rng=None):
+        """Lazily yield order examples; the same seed always yields the same corpus"""
+        rng = rng or random.Random(seed)
         
         # Order intent words
         order_intents = [
@@ -85,64 +224,64 @@ class ClassificationTestSuite:
         
         for i in range(count):
             # Generate different types of orders
-            order_type = random.choice([
+            order_type = rng.choice([
                 'simple_want', 'specific_product', 'with_budget', 'with_specs',
                 'urgent', 'casual', 'detailed', 'brand_specific'
             ])
             
             if order_type == 'simple_want':
-                intent = random.choice(order_intents)
-                product = random.choice(self.products)
+                intent = rng.choice(order_intents)
+                product = rng.choice(self.products)
                 order = f"{intent} {product}"
                 
             elif order_type == 'specific_product':
-                intent = random.choice(order_intents)
-                brand = random.choice(self.brands)
-                product = random.choice(self.products)
+                intent = rng.choice(order_intents)
+                brand = rng.choice(self.brands)
+                product = rng.choice(self.products)
                 order = f"{intent} {brand} {product}"
                 
             elif order_type == 'with_budget':
-                intent = random.choice(order_intents)
-                product = random.choice(self.products)
-                budget_expr = random.choice(budget_expressions)
-                price = random.randint(100, 50000)
-                price_format = random.choice(self.price_formats)
+                intent = rng.choice(order_intents)
+                product = rng.choice(self.products)
+                budget_expr = rng.choice(budget_expressions)
+                price = rng.randint(100, 50000)
+                price_format = rng.choice(self.price_formats)
                 formatted_price = price_format.format(price)
                 order = f"{intent} {product} with {budget_expr} {formatted_price}"
                 
             elif order_type == 'with_specs':
-                intent = random.choice(order_intents)
-                product = random.choice(self.products)
-                color = random.choice(self.colors)
-                size = random.choice(self.sizes)
+                intent = rng.choice(order_intents)
+                product = rng.choice(self.products)
+                color = rng.choice(self.colors)
+                size = rng.choice(self.sizes)
                 order = f"{intent} {color} {product} size {size}"
                 
             elif order_type == 'urgent':
-                urgency = random.choice(['urgently', 'desperately', 'immediately', 'asap'])
-                intent = random.choice(order_intents)
-                product = random.choice(self.products)
+                urgency = rng.choice(['urgently', 'desperately', 'immediately', 'asap'])
+                intent = rng.choice(order_intents)
+                product = rng.choice(self.products)
                 order = f"{urgency} {intent} {product}"
                 
             elif order_type == 'casual':
-                casual_start = random.choice(['hi', 'hello', 'hey', 'good morning', 'good evening'])
-                intent = random.choice(order_intents)
-                product = random.choice(self.products)
+                casual_start = rng.choice(['hi', 'hello', 'hey', 'good morning', 'good evening'])
+                intent = rng.choice(order_intents)
+                product = rng.choice(self.products)
                 order = f"{casual_start}, {intent} {product}"
                 
             elif order_type == 'detailed':
-                intent = random.choice(order_intents)
-                brand = random.choice(self.brands)
-                product = random.choice(self.products)
-                color = random.choice(self.colors)
-                material = random.choice(self.materials)
-                hardware = random.choice(self.hardware)
+                intent = rng.choice(order_intents)
+                brand = rng.choice(self.brands)
+                product = rng.choice(self.products)
+                color = rng.choice(self.colors)
+                material = rng.choice(self.materials)
+                hardware = rng.choice(self.hardware)
                 order = f"{intent} {brand} {product} in {color} {material} with {hardware}"
                 
             elif order_type == 'brand_specific':
-                intent = random.choice(order_intents)
-                brand = random.choice(self.brands)
-                product = random.choice(self.products)
-                size = random.choice(self.sizes)
+                intent = rng.choice(order_intents)
+                brand = rng.choice(self.brands)
+                product = rng.choice(self.products)
+                size = rng.choice(self.sizes)
                 order = f"{intent} {brand} {product} {size}"
             
             # Add variations and natural language elements
@@ -158,21 +297,23 @@ class ClassificationTestSuite:
                 lambda x: "wtb " + x,  # want to buy
             ]
             
-            if random.random() < 0.3:  # 30% chance of variation
-                variation = random.choice(variations)
+            if rng.random() < 0.3:  # 30% chance of variation
+                variation = rng.choice(variations)
                 order = variation(order)
             
-            orders.append({
+            yield {
                 'text': order,
                 'expected': 'Order',
                 'type': order_type
-            })
-            
-        return orders
+            }
     
-    def generate_offer_examples(self, count=5000):
+    def generate_offer_examples(self, count=5000, seed=None):
         """Generate diverse offer examples"""
-        offers = []
+        return list(self.iter_offer_examples(count, seed))
+    
+    def iter_offer_examples(self, count=5000, seed=None, rng=None):
+        """Lazily yield offer examples; the same seed always yields the same corpus"""
+        rng = rng or random.Random(seed)
         
         # Offer intent words
         offer_intents = [
@@ -199,72 +340,72 @@ class ClassificationTestSuite:
         
         for i in range(count):
             # Generate different types of offers
-            offer_type = random.choice([
+            offer_type = rng.choice([
                 'simple_sale', 'with_price', 'with_condition', 'with_specs',
                 'urgent_sale', 'detailed', 'authentic_claim', 'bundle_deal'
             ])
             
             if offer_type == 'simple_sale':
-                intent = random.choice(offer_intents)
-                product = random.choice(self.products)
+                intent = rng.choice(offer_intents)
+                product = rng.choice(self.products)
                 offer = f"{intent} {product}"
                 
             elif offer_type == 'with_price':
-                intent = random.choice(offer_intents)
-                product = random.choice(self.products)
-                price = random.randint(100, 50000)
-                price_format = random.choice(self.price_formats)
+                intent = rng.choice(offer_intents)
+                product = rng.choice(self.products)
+                price = rng.randint(100, 50000)
+                price_format = rng.choice(self.price_formats)
                 formatted_price = price_format.format(price)
                 offer = f"{intent} {product} {formatted_price}"
                 
             elif offer_type == 'with_condition':
-                intent = random.choice(offer_intents)
-                condition = random.choice(conditions)
-                product = random.choice(self.products)
+                intent = rng.choice(offer_intents)
+                condition = rng.choice(conditions)
+                product = rng.choice(self.products)
                 offer = f"{intent} {condition} {product}"
                 
             elif offer_type == 'with_specs':
-                intent = random.choice(offer_intents)
-                brand = random.choice(self.brands)
-                product = random.choice(self.products)
-                color = random.choice(self.colors)
-                size = random.choice(self.sizes)
+                intent = rng.choice(offer_intents)
+                brand = rng.choice(self.brands)
+                product = rng.choice(self.products)
+                color = rng.choice(self.colors)
+                size = rng.choice(self.sizes)
                 offer = f"{intent} {brand} {product} {color} size {size}"
                 
             elif offer_type == 'urgent_sale':
-                urgency = random.choice(urgency_words)
-                intent = random.choice(offer_intents)
-                product = random.choice(self.products)
-                price = random.randint(100, 50000)
-                price_format = random.choice(self.price_formats)
+                urgency = rng.choice(urgency_words)
+                intent = rng.choice(offer_intents)
+                product = rng.choice(self.products)
+                price = rng.randint(100, 50000)
+                price_format = rng.choice(self.price_formats)
                 formatted_price = price_format.format(price)
                 offer = f"{urgency} {intent} {product} {formatted_price}"
                 
             elif offer_type == 'detailed':
-                intent = random.choice(offer_intents)
-                brand = random.choice(self.brands)
-                product = random.choice(self.products)
-                color = random.choice(self.colors)
-                material = random.choice(self.materials)
-                condition = random.choice(conditions)
-                price = random.randint(100, 50000)
-                price_format = random.choice(self.price_formats)
+                intent = rng.choice(offer_intents)
+                brand = rng.choice(self.brands)
+                product = rng.choice(self.products)
+                color = rng.choice(self.colors)
+                material = rng.choice(self.materials)
+                condition = rng.choice(conditions)
+                price = rng.randint(100, 50000)
+                price_format = rng.choice(self.price_formats)
                 formatted_price = price_format.format(price)
                 offer = f"{intent} {condition} {brand} {product} in {color} {material} {formatted_price}"
                 
             elif offer_type == 'authentic_claim':
-                auth_claim = random.choice(['authentic', 'genuine', 'original', '100% authentic'])
-                brand = random.choice(self.brands)
-                product = random.choice(self.products)
-                intent = random.choice(offer_intents)
+                auth_claim = rng.choice(['authentic', 'genuine', 'original', '100% authentic'])
+                brand = rng.choice(self.brands)
+                product = rng.choice(self.products)
+                intent = rng.choice(offer_intents)
                 offer = f"{intent} {auth_claim} {brand} {product}"
                 
             elif offer_type == 'bundle_deal':
-                intent = random.choice(offer_intents)
-                product1 = random.choice(self.products)
-                product2 = random.choice(self.products)
-                price = random.randint(200, 80000)
-                price_format = random.choice(self.price_formats)
+                intent = rng.choice(offer_intents)
+                product1 = rng.choice(self.products)
+                product2 = rng.choice(self.products)
+                price = rng.randint(200, 80000)
+                price_format = rng.choice(self.price_formats)
                 formatted_price = price_format.format(price)
                 offer = f"{intent} {product1} and {product2} bundle {formatted_price}"
             
@@ -280,17 +421,15 @@ class ClassificationTestSuite:
                 lambda x: x + " shipping worldwide",
             ]
             
-            if random.random() < 0.3:  # 30% chance of variation
-                variation = random.choice(variations)
+            if rng.random() < 0.3:  # 30% chance of variation
+                variation = rng.choice(variations)
                 offer = variation(offer)
             
-            offers.append({
+            yield {
                 'text': offer,
                 'expected': 'Offer',
                 'type': offer_type
-            })
-            
-        return offers
+            }
     
     def run_classification_test(self, test_data):
         """Run classification test on provided data"""
@@ -343,23 +482,11 @@ class ClassificationTestSuite:
         
         # Analyze missed orders
         for text in results['pattern_gaps']['order_missed']:
-            words = text.lower().split()
-            # Look for potential order keywords
-            order_indicators = ['want', 'need', 'looking', 'searching', 'seeking', 
-                              'interested', 'hunting', 'require', 'desire', 'iso', 'wtb']
-            for word in words:
-                if any(indicator in word for indicator in order_indicators):
-                    analysis['missing_order_keywords'].add(word)
+            analysis['missing_order_keywords'] |= gap_keywords(text, ORDER_KEYWORD_HINTS)
         
         # Analyze missed offers
         for text in results['pattern_gaps']['offer_missed']:
-            words = text.lower().split()
-            # Look for potential offer keywords
-            offer_indicators = ['selling', 'sale', 'available', 'have', 'offering', 
-                              'listing', 'fs', 'authentic', 'genuine', 'condition']
-            for word in words:
-                if any(indicator in word for indicator in offer_indicators):
-                    analysis['missing_offer_keywords'].add(word)
+            analysis['missing_offer_keywords'] |= gap_keywords(text, OFFER_KEYWORD_HINTS)
         
         return analysis
     
@@ -369,34 +496,43 @@ class ClassificationTestSuite:
         
         # Order pattern suggestions
         if analysis['missing_order_keywords']:
-            order_keywords = '|'.join(analysis['missing_order_keywords'])
+            order_keywords = '|'.join(sorted(analysis['missing_order_keywords']))
             suggestions.append(f"Order pattern: r'\\b({order_keywords})\\b'")
         
         # Offer pattern suggestions
         if analysis['missing_offer_keywords']:
-            offer_keywords = '|'.join(analysis['missing_offer_keywords'])
+            offer_keywords = '|'.join(sorted(analysis['missing_offer_keywords']))
             suggestions.append(f"Offer pattern: r'\\b({offer_keywords})\\b'")
         
         return suggestions
     
-    def run_full_test_suite(self):
-        """Run the complete 10K test suite"""
-        print("Generating 10K classification test suite...")
-        
-        # Generate test data
-        orders = self.generate_order_examples(5000)
-        offers = self.generate_offer_examples(5000)
-        
-        # Combine and shuffle
-        all_tests = orders + offers
-        random.shuffle(all_tests)
-        
-        print(f"Generated {len(all_tests)} test examples")
-        print(f"Orders: {len(orders)}, Offers: {len(offers)}")
+    def run_stress_test(self, total=1000000, seed=0, workers=None, shard_size=50000, sample_size=100):
+        """Generate and classify `total` examples across processes with bounded memory"""
+        shards = []
+        for index, start in enumerate(range(0, total, shard_size)):
+            shards.append((index, min(shard_size, total - start), seed, sample_size))
+        
+        workers = workers or os.cpu_count() or 1
+        evaluation = StreamingEvaluation(sample_size)
+        if workers == 1:
+            for shard in shards:
+                evaluation.merge(_evaluate_shard(shard))
+        else:
+            with Pool(workers) as pool:
+                for shard_evaluation in pool.imap_unordered(_evaluate_shard, shards):
+                    evaluation.merge(shard_evaluation)
+        return evaluation
+    
+    def run_full_test_suite(self, total=10000, seed=None, workers=1, sample_size=100,
+                            output_path='/root/whatsapp-bot_v2/Deep/predictors/test_results.json'):
+        """Run the complete test suite (10K by default, streamed)"""
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        workers = workers or os.cpu_count() or 1
+        print(f"Generating and classifying {total} examples (seed={seed}, workers={workers})...")
         
-        # Run classification test
-        print("\nRunning classification tests...")
-        results = self.run_classification_test(all_tests)
+        evaluation = self.run_stress_test(total, seed=seed, workers=workers, sample_size=sample_size)
+        results = evaluation.summary()
         
         # Print results
         print(f"\n=== CLASSIFICATION RESULTS ===")
@@ -405,19 +541,28 @@ class ClassificationTestSuite:
         print(f"Incorrect: {results['incorrect']}")
         print(f"Accuracy: {results['accuracy']:.2f}%")
         
-        # Analyze patterns
-        analysis = self.analyze_missing_patterns(results)
+        print(f"\n=== CONFUSION MATRIX (rows: expected, columns: predicted) ===")
+        print("".join(f"{label:>10}" for label in [''] + LABELS))
+        for expected in LABELS:
+            row = results['confusion_matrix'][expected]
+            print(f"{expected:>10}" + "".join(f"{row[predicted]:>10}" for predicted in LABELS))
         
         print(f"\n=== PATTERN ANALYSIS ===")
-        print(f"Order patterns missed: {len(results['pattern_gaps']['order_missed'])}")
-        print(f"Offer patterns missed: {len(results['pattern_gaps']['offer_missed'])}")
-        print(f"Unknown classifications: {len(results['pattern_gaps']['unknown_classified'])}")
+        print(f"Order patterns missed: {results['pattern_gap_counts']['order_missed']}")
+        print(f"Offer patterns missed: {results['pattern_gap_counts']['offer_missed']}")
+        print(f"Unknown classifications: {results['pattern_gap_counts']['unknown_classified']}")
         
         # Show some examples of misclassified items
         print(f"\n=== SAMPLE MISCLASSIFICATIONS ===")
-        for i, item in enumerate(results['misclassified'][:10]):
+        for i, item in enumerate(results['sampled_misclassified'][:10]):
             print(f"{i+1}. '{item['text']}' -> Expected: {item['expected']}, Got: {item['predicted']}")
         
+        analysis = {
+            'missing_order_keywords': evaluation.missing_order_keywords,
+            'missing_offer_keywords': evaluation.missing_offer_keywords,
+            'suggested_patterns': []
+        }
+        
         # Generate suggestions
         suggestions = self.generate_pattern_suggestions(analysis)
         if suggestions:
@@ -426,19 +571,29 @@ class ClassificationTestSuite:
                 print(f"- {suggestion}")
         
         # Save detailed results
-        with open('/root/whatsapp-bot_v2/Deep/predictors/test_results.json', 'w') as f:
+        with open(output_path, 'w') as f:
             json.dump({
+                'seed': seed,
                 'results': results,
                 'analysis': {
-                    'missing_order_keywords': list(analysis['missing_order_keywords']),
-                    'missing_offer_keywords': list(analysis['missing_offer_keywords'])
+                    'missing_order_keywords': sorted(analysis['missing_order_keywords']),
+                    'missing_offer_keywords': sorted(analysis['missing_offer_keywords'])
                 },
                 'suggestions': suggestions
             }, f, indent=2)
         
-        print(f"\nDetailed results saved to test_results.json")
+        print(f"\nDetailed results saved to {os.path.basename(output_path)}")
         return results, analysis
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Classification stress test suite")
+    parser.add_argument("--total", type=int, default=10000, help="number of generated examples")
+    parser.add_argument("--seed", type=int, default=None, help="corpus seed (random if omitted)")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes (0 = all cores)")
+    parser.add_argument("--sample-size", type=int, default=100, help="misclassifications kept in the report")
+    parser.add_argument("--output", default='/root/whatsapp-bot_v2/Deep/predictors/test_results.json')
+    args = parser.parse_args()
+    
     suite = ClassificationTestSuite()
-    results, analysis = suite.run_full_test_suite()
\ No newline at end of file
+    results, analysis = suite.run_full_test_suite(args.total, seed=args.seed, workers=args.workers or None,
+                                                  sample_size=args.sample_size, output_path=args.output)
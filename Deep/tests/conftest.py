@@ -0,0 +1,6 @@
+import os
+import sys
+
+# matcher modules import `predictors.*`, the classifier modules import each other flat
+DEEP = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [DEEP, os.path.join(DEEP, "predictors")]
@@ -0,0 +1,67 @@
+import pytest
+
+from cascade import ClassificationCascade
+from preprocess import Preprocessor
+
+
+class RulesStub:
+    """Decides texts that start with "rule:", the rest stay unknown"""
+
+    def __init__(self):
+        self.preprocessor = Preprocessor(cache_path=None)
+
+    def classify(self, text):
+        return text.split(":", 1)[1] if text.startswith("rule:") else "unknown"
+
+
+class ModelStub:
+    """Returns a fixed (label, confidence) per text and records what it saw"""
+
+    def __init__(self, answers):
+        self.answers = answers
+        self.seen = []
+
+    def predict(self, texts):
+        self.seen.append(list(texts))
+        return [self.answers[text] for text in texts]
+
+
+def test_each_tier_only_sees_what_earlier_tiers_left():
+    fast = ModelStub({"a": ("Offer", 0.95), "b": ("Order", 0.8), "c": ("Offer", 0.79), "d": ("Order", 0.1)})
+    embedding = ModelStub({"c": ("Order", 0.5), "d": ("Offer", 0.49)})
+    cascade = ClassificationCascade(RulesStub(), fast, embedding, fast_confidence=0.8, embedding_confidence=0.5)
+
+    results = cascade.predict(["rule:Order", "a", "b", "c", "d"])
+
+    assert [(r["category"], r["method"]) for r in results] == [
+        ("Order", "rules"), ("Offer", "fast"), ("Order", "fast"), ("Order", "embedding"), ("unknown", "fallback")]
+    assert fast.seen == [["a", "b", "c", "d"]]
+    assert embedding.seen == [["c", "d"]]
+
+
+def test_missing_tiers_and_empty_batches_are_skipped():
+    fast = ModelStub({})
+    cascade = ClassificationCascade(RulesStub(), fast, None)
+    results = cascade.predict(["rule:Offer"])
+    assert results == [{"category": "Offer", "confidence": 1.0, "method": "rules"}]
+    assert fast.seen == []
+
+    assert ClassificationCascade(RulesStub()).predict(["hello"])[0]["method"] == "fallback"
+
+
+def test_stats_count_seen_and_decided_per_tier():
+    fast = ModelStub({"a": ("Offer", 0.9), "b": ("Order", 0.2)})
+    cascade = ClassificationCascade(RulesStub(), fast, None)
+    cascade.predict(["rule:Order", "a", "b"])
+    cascade.predict(["rule:Offer"])
+
+    tiers = cascade.stats.snapshot()["tiers"]
+    assert cascade.stats.snapshot()["messages"] == 4
+    assert (tiers["rules"]["seen"], tiers["rules"]["decided"]) == (4, 2)
+    assert (tiers["fast"]["seen"], tiers["fast"]["decided"]) == (2, 1)
+    assert (tiers["embedding"]["seen"], tiers["embedding"]["decided"]) == (0, 0)
+    assert (tiers["fallback"]["seen"], tiers["fallback"]["decided"]) == (1, 1)
+    assert tiers["rules"]["hit_rate"] == pytest.approx(0.5)
+
+    cascade.stats.reset()
+    assert cascade.stats.snapshot()["messages"] == 0
@@ -0,0 +1,140 @@
+import numpy as np
+
+from match_engine import MatchEngine, PriceIndex, SideIndex, representative_price, select_top_matches
+from preprocess import preprocess
+
+
+def offer(offer_id, number):
+    return {"id": offer_id, "number": number}
+
+
+def test_select_top_matches_caps_offers_per_seller():
+    candidates = [(0.9, offer("a1", "A")), (0.8, offer("a2", "A")), (0.7, offer("a3", "A")), (0.6, offer("b1", "B"))]
+    kept = select_top_matches(candidates, top_k=10, per_seller=2)
+    assert [o["id"] for _, o in kept] == ["a1", "a2", "b1"]
+
+
+def test_select_top_matches_keeps_best_top_k():
+    candidates = [(score / 10, offer(f"o{score}", f"seller{score}")) for score in range(1, 10)]
+    kept = select_top_matches(candidates, top_k=3, per_seller=1)
+    assert [score for score, _ in kept] == [0.9, 0.8, 0.7]
+
+
+def test_select_top_matches_zero_disables_caps():
+    candidates = [(0.5, offer("a1", "A")), (0.9, offer("a2", "A")), (0.7, offer("a3", "A"))]
+    kept = select_top_matches(candidates, top_k=0, per_seller=0)
+    assert [o["id"] for _, o in kept] == ["a2", "a3", "a1"]
+
+
+def test_select_top_matches_breaks_score_ties_without_comparing_dicts():
+    candidates = [(0.8, offer("a1", "A")), (0.8, offer("a2", "A")), (0.8, offer("a3", "A"))]
+    assert len(select_top_matches(candidates, top_k=2, per_seller=3)) == 2
+
+
+def test_side_index_query_ranks_hits_above_threshold():
+    index = SideIndex()
+    index.add([{"id": "x"}, {"id": "y"}, {"id": "z"}], np.array([[1, 0], [0.8, 0.6], [0, 1]]))
+    hits = index.query(np.array([[1, 0]]), threshold=0.5, top_k=0)
+    assert [(round(score, 3), doc_id) for score, doc_id in hits[0]] == [(1.0, "x"), (0.8, "y")]
+    assert index.query(np.array([[1, 0]]), threshold=0.5, top_k=1)[0][0][1] == "x"
+
+
+def test_side_index_query_drops_excluded_positions():
+    index = SideIndex()
+    index.add([{"id": "x"}, {"id": "y"}, {"id": "z"}], np.array([[1, 0], [0.8, 0.6], [0, 1]]))
+    query = np.array([[1, 0], [1, 0]])
+    hits = index.query(query, threshold=0.5, top_k=0, excluded=[[index.positions["x"]], None])
+    assert [doc_id for _, doc_id in hits[0]] == ["y"]
+    assert [doc_id for _, doc_id in hits[1]] == ["x", "y"]
+
+
+def constant_encode(texts):
+    return np.ones((len(texts), 4), dtype=np.float32) / 2
+
+
+def matched_pairs(engine):
+    return {(order["id"], offer["id"]) for order, matched in engine.results() for _, offer in matched}
+
+
+def test_results_do_not_depend_on_arrival_order():
+    orders = [{"id": f"order{i}", "text": "need kelly", "number": f"buyer{i}"} for i in range(100)]
+    offers = [{"id": "offer0", "text": "kelly available", "number": "seller"}]
+
+    orders_first = MatchEngine(constant_encode, top_k=20, per_seller=3)
+    orders_first.add("order", orders)
+    orders_first.add("offer", offers)
+
+    offers_first = MatchEngine(constant_encode, top_k=20, per_seller=3)
+    offers_first.add("offer", offers)
+    offers_first.add("order", orders)
+
+    assert len(matched_pairs(orders_first)) == 100
+    assert matched_pairs(orders_first) == matched_pairs(offers_first)
+
+    # One seller reposting the same bag must not crowd out the other sellers
+    vectors = {"need kelly": [1.0, 0.0], "b": [0.7, np.sqrt(1 - 0.7 ** 2)]}
+    vectors.update({f"a{i}": [0.9 - i / 100, np.sqrt(1 - (0.9 - i / 100) ** 2)] for i in range(5)})
+    reposts = [{"id": f"a{i}", "text": f"a{i}", "number": "A"} for i in range(5)]
+    reposts.append({"id": "b", "text": "b", "number": "B"})
+    order = [{"id": "order", "text": "need kelly", "number": "buyer"}]
+
+    def encode(texts):
+        return np.array([vectors[text] for text in texts], dtype=np.float32)
+
+    results = []
+    for first, second in ((("order", order), ("offer", reposts)), (("offer", reposts), ("order", order))):
+        engine = MatchEngine(encode, top_k=2, per_seller=1)
+        engine.add(*first)
+        engine.add(*second)
+        results.append(matched_pairs(engine))
+    assert results == [{("order", "a0"), ("order", "b")}] * 2
+
+
+def test_price_index_compares_bare_amounts_with_every_currency():
+    prices = PriceIndex()
+    prices.add(0, 1000, "EUR")
+    prices.add(1, 5000, "EUR")
+    prices.add(2, 3000, None)
+    prices.add(3, 9000, "USD")
+    assert sorted(prices.above(2000, "EUR")) == [1, 2]
+    assert sorted(prices.below(4000, "EUR")) == [0, 2]
+    assert sorted(prices.above(2000, None)) == [1, 2, 3]
+
+
+def test_representative_price_prefers_stated_currency():
+    doc = {"prices": [{"amount": 25, "currency": None}, {"amount": 14500, "currency": "EUR"}]}
+    assert representative_price(doc, min) == {"amount": 14500, "currency": "EUR"}
+    assert representative_price({"prices": []}, max) is None
+
+
+def priced_doc(doc_id, text):
+    return {"id": doc_id, "text": text, "number": doc_id, "prices": preprocess(text)["prices"]}
+
+
+def test_price_filter_keeps_orders_without_a_budget():
+    engine = MatchEngine(constant_encode, price_tolerance=0.15)
+    engine.add("offer", [priced_doc("cheap", "kelly 25 for 14500 eur"), priced_doc("dear", "kelly 25 for 30000 eur")])
+    engine.add("order", [priced_doc("stamp", "need kelly 25 2023 stamp"), priced_doc("budget", "need kelly 25 budget 15000 eur")])
+    assert matched_pairs(engine) == {("stamp", "cheap"), ("stamp", "dear"), ("budget", "cheap")}
+
+
+def test_save_and_load_round_trip(tmp_path):
+    engine = MatchEngine(constant_encode)
+    engine.add("offer", [{"id": "offer0", "text": "kelly 25 available €14500", "number": "seller"}])
+    engine.add("order", [{"id": "order0", "text": "need kelly 25", "number": "buyer"}])
+    engine.checkpoint = {"last_id": "65f000000000000000000001", "processed": 2}
+    path = tmp_path / "checkpoint.npz"
+    engine.save(str(path))
+
+    with np.load(path) as saved:
+        assert saved["state"].dtype == np.uint8
+    loaded = MatchEngine.load(str(path), constant_encode)
+    assert loaded.checkpoint == engine.checkpoint
+    assert loaded.matches == engine.matches
+    assert loaded.index["offer"].docs == engine.index["offer"].docs
+    np.testing.assert_array_equal(loaded.index["order"].vectors, engine.index["order"].vectors)
+    assert loaded.knows("offer0") and loaded.knows("order0") and not loaded.knows("other")
+
+
+def test_load_returns_none_without_a_checkpoint(tmp_path):
+    assert MatchEngine.load(str(tmp_path / "missing.npz"), constant_encode) is None
@@ -0,0 +1,81 @@
+import threading
+
+from match_scheduler import MatchScheduler
+
+
+class Recorder:
+    def __init__(self):
+        self.batches = []
+        self.ready = threading.Event()
+
+    def __call__(self, ids):
+        self.batches.append(ids)
+        self.ready.set()
+
+
+def test_duplicate_ids_are_merged_into_one_batch():
+    recorder = Recorder()
+    scheduler = MatchScheduler(recorder, debounce=10, max_batch=100, max_delay=10)
+    assert scheduler.submit("a") is True
+    assert scheduler.submit("b") is True
+    assert scheduler.submit("a") is False
+    scheduler.close()
+    assert recorder.batches == [["a", "b"]]
+
+
+def test_full_batch_is_flushed_without_waiting_for_debounce():
+    recorder = Recorder()
+    scheduler = MatchScheduler(recorder, debounce=10, max_batch=3, max_delay=10)
+    for message_id in "abc":
+        scheduler.submit(message_id)
+    assert recorder.ready.wait(2)
+    assert recorder.batches == [["a", "b", "c"]]
+    for message_id in "defgh":
+        scheduler.submit(message_id)
+    scheduler.close()
+    assert recorder.batches == [["a", "b", "c"], ["d", "e", "f"], ["g", "h"]]
+
+
+def test_quiet_stream_is_flushed_after_debounce():
+    recorder = Recorder()
+    scheduler = MatchScheduler(recorder, debounce=0.05, max_batch=100, max_delay=10)
+    scheduler.submit("a")
+    assert recorder.ready.wait(2)
+    assert recorder.batches == [["a"]]
+    scheduler.close()
+
+
+def test_close_without_flush_drops_pending_ids():
+    recorder = Recorder()
+    scheduler = MatchScheduler(recorder, debounce=10, max_batch=100, max_delay=10)
+    scheduler.submit("a")
+    scheduler.close(flush=False)
+    assert recorder.batches == []
+
+
+def test_failed_batch_is_retried():
+    attempts = []
+
+    def flaky(ids):
+        attempts.append(ids)
+        if len(attempts) == 1:
+            raise ConnectionError("mongo unavailable")
+
+    scheduler = MatchScheduler(flaky, debounce=10, max_batch=100, max_delay=10, retry_delay=0)
+    scheduler.submit("a")
+    scheduler.submit("b")
+    scheduler.close()
+    assert attempts == [["a", "b"], ["a", "b"]]
+
+
+def test_failing_ids_are_dropped_after_max_retries():
+    attempts = []
+
+    def broken(ids):
+        attempts.append(ids)
+        raise ValueError("bad batch")
+
+    scheduler = MatchScheduler(broken, debounce=10, max_batch=100, max_delay=10, max_retries=2, retry_delay=0)
+    scheduler.submit("a")
+    scheduler.close()
+    assert attempts == [["a"]] * 3
@@ -0,0 +1,70 @@
+import json
+import re
+
+import pytest
+
+from perfect_classifier import RULES_PATH, PerfectClassifier
+from preprocess import Preprocessor
+
+
+@pytest.fixture
+def rules_file(tmp_path):
+    path = tmp_path / "rules.json"
+    with open(RULES_PATH, encoding="utf-8") as f:
+        path.write_text(f.read(), encoding="utf-8")
+    return path
+
+
+def load_rules(path):
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def write_rules(path, rules):
+    path.write_text(json.dumps(rules), encoding="utf-8")
+
+
+def new_classifier(path):
+    return PerfectClassifier(str(path), preprocessor=Preprocessor(cache_path=None))
+
+
+def test_explain_spans_index_the_normalized_text():
+    classifier = PerfectClassifier(preprocessor=Preprocessor(cache_path=None))
+    explanation = classifier.explain("\U0001F45C  need white k20 rghw urgently")
+    assert explanation["normalized"] == "need white k20 rghw urgently"
+    for hit in explanation["order_indicators"] + explanation["product_terms"]:
+        start, end = hit["span"]
+        assert explanation["normalized"][start:end] == hit["match"]
+
+
+def test_reload_swaps_in_edited_rules(rules_file):
+    classifier = new_classifier(rules_file)
+    old_digest = classifier.rules.digest
+    assert classifier.classify("zzyzx kelly 25") == "unknown"
+
+    rules = load_rules(rules_file)
+    rules["offer_patterns"].append({"name": "test_offer_word", "pattern": r"\bzzyzx\b"})
+    write_rules(rules_file, rules)
+    assert classifier.reload() is True
+    assert classifier.rules.digest != old_digest
+    assert classifier.classify("zzyzx kelly 25") == "Offer"
+
+
+def test_reload_of_unchanged_file_is_a_no_op(rules_file):
+    classifier = new_classifier(rules_file)
+    active = classifier.rules
+    assert classifier.reload() is False
+    assert classifier.rules is active
+
+
+@pytest.mark.parametrize("corrupt, error", [
+    (lambda path: path.write_text("{not json", encoding="utf-8"), json.JSONDecodeError),
+    (lambda path: write_rules(path, dict(load_rules(path), order_patterns=[{"name": "broken", "pattern": "(unclosed"}])), re.error),
+])
+def test_failed_reload_keeps_previous_rules(rules_file, corrupt, error):
+    classifier = new_classifier(rules_file)
+    active = classifier.rules
+    corrupt(rules_file)
+    with pytest.raises(error):
+        classifier.reload()
+    assert classifier.rules is active
+    assert classifier.classify("need white k20 rghw urgently") == "Order"
@@ -0,0 +1,46 @@
+import os
+
+import preprocess
+
+
+def test_forked_child_gets_its_own_sqlite_connection(tmp_path, monkeypatch):
+    monkeypatch.setattr(preprocess, "CACHE_PATH", str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr(preprocess, "_shared", None)
+    parent = preprocess.get_preprocessor()
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        child = preprocess.get_preprocessor()
+        ok = child is not parent and child._db is not None and parent._db is None
+        child.process("need kelly 25")
+        child.flush()
+        os.write(write_end, b"1" if ok else b"0")
+        os._exit(0)
+    os.close(write_end)
+    os.waitpid(pid, 0)
+    assert os.read(read_end, 1) == b"1"
+    assert parent._db is not None
+    assert parent.process_many(["need kelly 25"])[0]["lower"] == "need kelly 25"
+
+
+def prices(text):
+    return [(price["amount"], price["currency"]) for price in preprocess.preprocess(text)["prices"]]
+
+
+def test_years_sizes_and_phone_numbers_are_not_prices():
+    assert prices("need kelly 25 2023 stamp") == []
+    assert prices("need iphone 15 pro 256 gb") == []
+    assert prices("call me on 501234567") == []
+    assert prices("selling 18k gold ring") == []
+    assert prices("18k white gold cartier love bracelet 4500 eur") == [(4500, "EUR")]
+    assert prices("need love bracelet budget 18k") == [(18000, None)]
+
+
+def test_currency_and_price_words_mark_prices():
+    assert prices("selling kelly 28 for 14,500 euro, 2024 stamp") == [(14500, "EUR")]
+    assert prices("k25 14500 eur 2024 stamp") == [(14500, "EUR")]
+    assert prices("b25 gold ghw 25 €12,500") == [(12500, "EUR")]
+    assert prices("$950 or rs 4500") == [(950, "USD"), (4500, "PKR")]
+    assert prices("€2000") == [(2000, "EUR")]
+    assert prices("black b25 shw just arrived 4900 only") == [(4900, None)]
+    assert prices("budget of 3.5k") == [(3500, None)]
@@ -493,28 +493,43 @@ async function startSocket(sessionId = 'default', name = '') {
     savedMsg.link = `${APP_URL}/index.html#msg-${savedMsg._id}`;
     await savedMsg.save();
 
-    await runMatcher();
+    scheduleMatch(savedMsg._id.toString());
   });
 
   notification.initialize(sock);
 }
 
-function runMatcher() {
-  return new Promise((resolve, reject) => {
-    const python = spawn('python3', ['Deep/matcher.py']);
-    let data = '';
-    python.stdout.on('data', (chunk) => { data += chunk.toString(); });
-    python.stderr.on('data', (err) => console.error('Python error:', err.toString()));
-    python.on('close', (code) => {
-      if (code === 0) {
-        fs.writeFileSync('match_results.json', data);
-        console.log('✅ Updated match_results.json');
-        resolve();
-      } else {
-        reject(new Error('Python matcher failed.'));
-      }
-    });
+// ✅ Long-running matcher in scheduler mode: new message ids go to its stdin and
+// bursts are coalesced into one batched pass (it writes match_results.json itself)
+let matcherProcess = null;
+
+function getMatcher() {
+  if (matcherProcess) return matcherProcess;
+  const matcher = spawn('python3', ['Deep/matcher.py', '--serve']);
+  matcher.stdout.on('data', (chunk) => console.log('✅ Matcher:', chunk.toString().trim()));
+  matcher.stderr.on('data', (err) => console.error('Python error:', err.toString()));
+  // ENOENT (python3 missing) or EPIPE (write racing the matcher's exit) must not crash the bot
+  matcher.on('error', (err) => {
+    console.error('❌ Matcher error:', err.message);
+    if (matcherProcess === matcher) matcherProcess = null;
+  });
+  matcher.stdin.on('error', (err) => console.error('❌ Matcher stdin error:', err.message));
+  matcher.on('close', (code) => {
+    console.error(`❌ Matcher exited with code ${code}`);
+    if (matcherProcess === matcher) matcherProcess = null;
   });
+  matcherProcess = matcher;
+  return matcher;
+}
+
+function scheduleMatch(messageId) {
+  const matcher = getMatcher();
+  // A dropped id is not lost: the next matcher start catches up on everything after its checkpoint
+  if (matcher.exitCode !== null || !matcher.stdin.writable) {
+    console.error(`❌ Matcher not accepting input; ${messageId} will be matched on restart`);
+    return;
+  }
+  matcher.stdin.write(`${messageId}\n`);
 }
 
 // ===== Start Server =====